@@ -0,0 +1,293 @@
+# benchmark suite for the hot paths of the sim (flock updates, predator, rendering, text, lighting, map loading).
+# Run from the code folder (asset paths are relative to it), e.g.
+#   python benchmark.py --out results.json                  time everything and save the results
+#   python benchmark.py --baseline results.json             compare against saved results, exits 1 on a regression
+#   python benchmark.py -k flock_update --quick             only cases with 'flock_update' in their name, fewer samples
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no display needed (must be set before pygame is imported)
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # keep stdout clean for --json
+
+import argparse, json, platform, random, sys, time
+import numpy as np
+import pygame
+from game_data import screen_width, screen_height, fonts
+from boids import Flock, Boid, BoidPredator
+from flock_stats import FlockStats
+
+# name: setup function. Setup builds everything a case needs and returns the function to time
+cases = {}
+
+
+def case(name):
+    def register(setup):
+        cases[name] = setup
+        return setup
+    return register
+
+
+def seed():
+    random.seed(0)
+    np.random.seed(0)
+
+
+# -- flock --
+
+# sizes and densities: 'normal' is the game screen, 'dense' packs the same flock into a quarter of the area
+flock_sizes = {'objects': [50, 500, 2000], 'numpy': [50, 2000, 5000]}
+flock_densities = {'normal': (screen_width, screen_height), 'dense': (screen_width // 2, screen_height // 2)}
+
+
+def setup_flock_update(backend, size, dimensions):
+    def setup():
+        seed()
+        flock = Flock(pygame.Surface(dimensions), size, backend=backend)
+        return flock.update
+    return setup
+
+
+def setup_flock_draw(backend, size, sprites=False):
+    def setup():
+        seed()
+        flock = Flock(pygame.Surface((screen_width, screen_height)), size, backend=backend, sprites=sprites)
+        for i in range(10):
+            flock.update()
+        return flock.draw
+    return setup
+
+
+for backend, sizes in flock_sizes.items():
+    for size in sizes:
+        for density, dimensions in flock_densities.items():
+            case(f'flock_update[{backend}-{size}-{density}]')(setup_flock_update(backend, size, dimensions))
+        case(f'flock_draw[{backend}-{size}]')(setup_flock_draw(backend, size))
+        case(f'flock_draw[{backend}-{size}-sprites]')(setup_flock_draw(backend, size, True))
+
+
+# 20000 boids spread over a world 20 screens across and down (sparse chunk grid)
+@case('flock_update[numpy-20000-world]')
+def setup_flock_update_world():
+    seed()
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 20000, backend='numpy',
+                  world_size=(screen_width * 20, screen_height * 20))
+    return flock.update
+
+
+# uniform density, no edges for the flock to bunch up against
+@case('flock_update[numpy-5000-wrap]')
+def setup_flock_update_wrap():
+    seed()
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 5000, backend='numpy', wrap=True)
+    return flock.update
+
+
+# many predators hunting the boids around them, each boid only checks predators in nearby chunks
+@case('flock_update[numpy-5000-predators-200]')
+def setup_flock_update_predators():
+    seed()
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 5000, True, backend='numpy', predators=200,
+                  predator_targeting='local')
+    return flock.update
+
+
+# every boid samples the wind field where it is
+@case('flock_update[numpy-5000-wind-field]')
+def setup_flock_update_wind_field():
+    seed()
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 5000, use_wind=True, backend='numpy', wind_field=True)
+    return flock.update
+
+
+# numpy-20000-world as a hierarchical flock, 3 rings of chunk summaries around every boid's near field
+@case('flock_update[numpy-20000-world-clusters-3]')
+def setup_flock_update_clusters():
+    seed()
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 20000, backend='numpy',
+                  world_size=(screen_width * 20, screen_height * 20), cluster_range=3)
+    return flock.update
+
+
+@case('boid_draw')
+def setup_boid_draw():
+    seed()
+    boid = Boid(pygame.Surface((screen_width, screen_height)))
+    boid.rot_deg = 30
+    return boid.draw
+
+
+@case('predator_update[2000]')
+def setup_predator_update():
+    seed()
+    surface = pygame.Surface((screen_width, screen_height))
+    boids = [Boid(surface) for i in range(2000)]
+    stats = FlockStats()
+    stats.set_arrays(np.array([b.pos for b in boids]), np.array([b.vel for b in boids]))
+    predator = BoidPredator(surface)
+    wind = [0, 0]
+    return lambda: predator.update(stats, wind)
+
+
+# -- text and lighting --
+
+@case('font_render')
+def setup_font_render():
+    from text import Font
+    font = Font(fonts['small_font'], 'white')
+    surface = pygame.Surface((screen_width, screen_height))
+    return lambda: font.render('FPS: 59.99400329589844', surface, (0, 0))
+
+
+@case('light_update')
+def setup_light_update():
+    from lighting import Light
+    seed()
+    light = Light(pygame.Surface((screen_width, screen_height)), (200, 200), (40, 40, 40), False, 60, 40, 0.05)
+    return lambda: light.update(1, (200, 200))
+
+
+@case('light_draw')
+def setup_light_draw():
+    from lighting import Light
+    seed()
+    light = Light(pygame.Surface((screen_width, screen_height)), (200, 200), (40, 40, 40), False, 60, 40, 0.05)
+    return light.draw
+
+
+# -- map loading --
+
+@case('load_pygame[room_0]')
+def setup_load_pygame():
+    from pytmx.util_pygame import load_pygame
+    return lambda: load_pygame('../rooms/tiled_rooms/room_0.tmx')
+
+
+@case('distance_field[room_0]')
+def setup_distance_field():
+    import pytmx
+    from obstacles import DistanceField
+    tmx_data = pytmx.TiledMap('../rooms/tiled_rooms/room_0.tmx')
+    return lambda: DistanceField.from_tmx(tmx_data)
+
+
+# boids steering around room_0's collideable tiles
+@case('flock_update[numpy-5000-obstacles]')
+def setup_flock_update_obstacles():
+    import pytmx
+    from obstacles import DistanceField
+    seed()
+    obstacles = DistanceField.from_tmx(pytmx.TiledMap('../rooms/tiled_rooms/room_0.tmx'))
+    flock = Flock(pygame.Surface((screen_width, screen_height)), 5000, backend='numpy', obstacles=obstacles)
+    return flock.update
+
+
+# -------------------------------------------------------------------------------- #
+
+# times func repeats times (each sample is the mean of number calls) and returns stats in milliseconds per call.
+# number 0 picks enough calls for a sample to take about sample_time seconds (like timeit's autorange)
+def time_case(func, repeats, number, warmup, sample_time=0.02):
+    for i in range(warmup):
+        start = time.perf_counter()
+        func()
+        call_time = time.perf_counter() - start
+    if number == 0:
+        number = max(1, int(sample_time / call_time)) if warmup > 0 and call_time > 0 else 1
+    samples = []
+    for r in range(repeats):
+        start = time.perf_counter()
+        for i in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1000)
+
+    samples = np.array(samples)
+    return {'repeats': repeats,
+            'number': number,
+            'mean_ms': float(samples.mean()),
+            'std_ms': float(samples.std()),
+            'min_ms': float(samples.min()),
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p90_ms': float(np.percentile(samples, 90)),
+            'p99_ms': float(np.percentile(samples, 99)),
+            'max_ms': float(samples.max())}
+
+
+# compares the p50 of every case in both results, returns {name: comparison}
+def compare(results, baseline, threshold):
+    comparisons = {}
+    for name, stats in results['cases'].items():
+        if name not in baseline['cases']:
+            continue
+        ratio = stats['p50_ms'] / baseline['cases'][name]['p50_ms']
+        comparisons[name] = {'baseline_p50_ms': baseline['cases'][name]['p50_ms'],
+                             'p50_ms': stats['p50_ms'],
+                             'ratio': ratio,
+                             'regression': ratio > threshold}
+    return comparisons
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the boid sim.')
+    parser.add_argument('-k', dest='filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--list', action='store_true', help='list cases and exit')
+    parser.add_argument('--repeats', type=int, default=30, help='samples per case')
+    parser.add_argument('--number', type=int, default=0, help='calls per sample (0 picks automatically)')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed calls before sampling')
+    parser.add_argument('--quick', action='store_true', help='5 samples of 1 call, for a fast smoke run')
+    parser.add_argument('--out', help='write results to this json file')
+    parser.add_argument('--baseline', help='json results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.1, help='p50 ratio over the baseline that is a regression')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    names = [name for name in cases if args.filter in name]
+    if args.list:
+        print('\n'.join(names))
+        return
+
+    if args.quick:
+        args.repeats, args.number, args.warmup = 5, 1, 1
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))  # images are converted to the display format when loaded
+
+    results = {'meta': {'python': platform.python_version(),
+                        'pygame': pygame.version.ver,
+                        'numpy': np.__version__,
+                        'platform': platform.platform(),
+                        'processor': platform.processor(),
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'cases': {}}
+    for name in names:
+        stats = time_case(cases[name](), args.repeats, args.number, args.warmup)
+        results['cases'][name] = stats
+        if not args.json:
+            print(f"{name:<40} p50 {stats['p50_ms']:9.3f}ms  p90 {stats['p90_ms']:9.3f}ms  "
+                  f"p99 {stats['p99_ms']:9.3f}ms")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        results['comparison'] = compare(results, baseline, args.threshold)
+        regressions = [name for name, c in results['comparison'].items() if c['regression']]
+        if not args.json:
+            print()
+            for name, c in results['comparison'].items():
+                flag = '  REGRESSION' if c['regression'] else ''
+                print(f"{name:<40} {c['baseline_p50_ms']:9.3f}ms -> {c['p50_ms']:9.3f}ms  x{c['ratio']:.2f}{flag}")
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.json:
+        print(json.dumps(results))
+
+    if regressions:
+        sys.exit(1)
+    return results
+
+
+if __name__ == '__main__':
+    main()
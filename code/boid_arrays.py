@@ -0,0 +1,413 @@
+import numpy as np
+from profiler import profiler
+from rng import get_random_positions
+
+# rough cap on the number of neighbour pairs evaluated at once, keeps temporary arrays small for very dense flocks
+pair_batch_size = 2 ** 20
+
+
+# structure-of-arrays flock backend. Instead of a python Boid object per agent, every boid is a row in contiguous
+# numpy arrays (pos, vel, heading) and the flocking rules are evaluated for the whole flock as batched array operations.
+# All boids read the previous frame's state, so unlike the object backend the result does not depend on update order.
+class BoidArrays:
+    # world_size (width, height) is the area the flock flies over, the surface if None.
+    # rng (np.random or a np.random.RandomState) lays the flock out
+    def __init__(self, surface, flock_size, chunks, world_size=None, rng=np.random):
+        self.surface = surface
+        self.size = flock_size
+        self.chunks = chunks  # spatial hash shared with the Flock (includes the 1 chunk margin around the world)
+        self.width, self.height = world_size if world_size is not None else surface.get_size()
+        # toroidal world (the chunk grid wraps), boids leaving one edge come back at the opposite edge and see
+        # neighbours across edges
+        self.wrap = chunks.wrap
+        # predators are binned in a grid of their own laid out like the boids' chunks, so each boid only checks the
+        # predators in the 3x3 chunks around it
+        self.predator_chunks = type(chunks)(chunks.cell_size, chunks.cells_width, chunks.cells_height, chunks.origin,
+                                            chunks.wrap)
+
+        # - agent state -
+        self.pos = get_random_positions(rng, flock_size, self.width, self.height)  # x, y
+        self.vel = np.zeros((flock_size, 2))  # x, y
+        self.heading = np.zeros(flock_size)  # radians, 0 points down the y axis (same convention as Boid.rot_deg)
+        self.last_update = np.zeros(flock_size, dtype=np.int64)  # tick of each boid's last update (level of detail)
+        self.all = np.arange(flock_size)  # index of every boid
+
+        # - rule constants (mirror Boid so both backends fly the same flock) -
+        self.min_speed = 1
+        self.max_speed = 5
+
+        self.protected_r = 10
+        self.visual_r = 80  # MUST BE LESS THAN CHUNK SIZE
+
+        self.turn_factor = 0.1
+        self.screen_margin = 200
+
+        self.matching_factor = 0.05
+        self.centering_factor = 0.005
+        self.escape_factor = 0.2
+        self.obstacle_margin = 40
+        self.avoid_factor = 1
+
+        self.obstacles = None  # DistanceField of the level's solid tiles to steer around (set by Flock)
+        # 60ths of a second each update covers (set by Flock tick_rate), the rules are tuned for 60 updates a second
+        self.tick_scale = 1
+        # rings of chunks around each boid's 3x3 block that are felt through chunk summaries (set by Flock clusters)
+        self.cluster_range = 0
+
+    def __len__(self):
+        return self.size
+
+    # pickled when handed to parallel workers (flock_pool), which never draw
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['surface'] = None
+        return state
+
+    # -- chunks --
+
+    # clamps boids that left the chunk area back into the margin chunks (same as the object backend) and returns
+    # each boid's chunk column and row
+    def get_chunks(self):
+        if self.wrap:
+            return self.get_cells(self.pos)
+        chunks = self.chunks
+        pos = self.pos
+        cx, cy = chunks.get_cell_coords(pos)
+
+        pos[cy < 0, 1] = chunks.origin[1]
+        pos[cy >= chunks.cells_height, 1] = chunks.origin[1] + chunks.cells_height * chunks.cell_size
+        pos[cx < 0, 0] = chunks.origin[0]
+        pos[cx >= chunks.cells_width, 0] = chunks.origin[0] + chunks.cells_width * chunks.cell_size
+
+        np.clip(cx, 0, chunks.cells_width - 1, out=cx)
+        np.clip(cy, 0, chunks.cells_height - 1, out=cy)
+        return cx, cy
+
+    # returns the chunk column and row of any positions (n, 2) (e.g. predators), clipped into the grid.
+    # wrapped worlds are split into whole cells (each at least a chunk across), so the world need not be a multiple of
+    # the chunk size, and positions off the world wrap onto it
+    def get_cells(self, pos):
+        chunks = self.chunks
+        if self.wrap:
+            cx = (pos[:, 0] % self.width * (chunks.cells_width / self.width)).astype(np.intp)
+            cy = (pos[:, 1] % self.height * (chunks.cells_height / self.height)).astype(np.intp)
+        else:
+            cx, cy = chunks.get_cell_coords(pos)
+        np.clip(cx, 0, chunks.cells_width - 1, out=cx)
+        np.clip(cy, 0, chunks.cells_height - 1, out=cy)
+        return cx, cy
+
+    # wraps offsets (n, 2) or dx and dy arrays across the world to the shortest offset (minimum image)
+    def get_min_image(self, dx, dy):
+        dx -= self.width * np.round(dx / self.width)
+        dy -= self.height * np.round(dy / self.height)
+        return dx, dy
+
+    # returns the summed (n, 2) offsets from every predator (predator_pos (m, 2)) within visual range of each boid at
+    # pos (n, 2)
+    def get_escape(self, pos, predator_pos):
+        self.predator_chunks.insert_coords(*self.get_cells(predator_pos))
+        i, p = self.predator_chunks.get_block_pairs(*self.get_cells(pos))
+        away = pos[i] - predator_pos[p]
+        if self.wrap:
+            self.get_min_image(away[:, 0], away[:, 1])
+        escaping = (away ** 2).sum(axis=1) <= self.visual_r ** 2
+        escape = np.empty((len(pos), 2))
+        escape[:, 0] = np.bincount(i, away[:, 0] * escaping, len(pos))
+        escape[:, 1] = np.bincount(i, away[:, 1] * escaping, len(pos))
+        return escape
+
+    # returns the centre of the boids in the 3x3 chunks around each predator (predator_pos (m, 2)). Predators with no
+    # boids that near look around the nearest occupied chunk instead (None only if the flock is empty). Bins the flock
+    # where it is now, so the centres never depend on an earlier binning (which a restored snapshot doesn't have)
+    def get_local_centres(self, predator_pos):
+        self.chunks.insert_coords(*self.get_cells(self.pos))
+        cx, cy = self.get_cells(predator_pos)
+        centres = self.get_block_centres(predator_pos, cx, cy)
+        lost = [p for p, centre in enumerate(centres) if centre is None]
+        if lost and self.size:
+            near_x, near_y = self.get_nearest_occupied(cx[lost], cy[lost])
+            for p, centre in zip(lost, self.get_block_centres(predator_pos[lost], near_x, near_y)):
+                centres[p] = centre
+        return centres
+
+    # returns the centre of the boids in the 3x3 chunks around chunk (cx, cy) (m,) for each position pos (m, 2) (None
+    # where there are none), measured from pos so wrapped worlds count boids across an edge where they appear
+    def get_block_centres(self, pos, cx, cy):
+        i, j = self.chunks.get_block_pairs(cx, cy)
+        offset = self.pos[j] - pos[i]
+        if self.wrap:
+            self.get_min_image(offset[:, 0], offset[:, 1])
+        m = len(pos)
+        count = np.bincount(i, minlength=m)
+        seen = np.maximum(count, 1)
+        x = pos[:, 0] + np.bincount(i, offset[:, 0], m) / seen
+        y = pos[:, 1] + np.bincount(i, offset[:, 1], m) / seen
+        return [[x[p], y[p]] if count[p] else None for p in range(m)]
+
+    # returns the column and row of the occupied chunk nearest each chunk (cx, cy) (m,), by chunk distance (the short
+    # way round wrapped worlds). Uses the chunks as last binned, which must hold at least one boid
+    def get_nearest_occupied(self, cx, cy):
+        cells_width = self.chunks.cells_width
+        cells_height = self.chunks.cells_height
+        occupied = np.asarray(self.chunks.get_occupied())
+        oy, ox = np.divmod(occupied, cells_width)
+        near_x = np.empty(len(cx), dtype=np.intp)
+        near_y = np.empty(len(cx), dtype=np.intp)
+        for p in range(len(cx)):
+            dx = ox - cx[p]
+            dy = oy - cy[p]
+            if self.wrap:
+                dx -= cells_width * np.round(dx / cells_width).astype(dx.dtype)
+                dy -= cells_height * np.round(dy / cells_height).astype(dy.dtype)
+            nearest = np.argmin(dx * dx + dy * dy)
+            near_x[p] = ox[nearest]
+            near_y[p] = oy[nearest]
+        return near_x, near_y
+
+    # -- rules --
+
+    # accumulates separation, alignment and cohesion sums for boids from their candidate neighbour pairs.
+    # pairs_i index into boids, pairs_j are flock indices
+    def get_neighbour_sums(self, boids, pairs_i, pairs_j):
+        n = len(boids)
+        close = np.zeros((n, 2))
+        pos_sum = np.zeros((n, 2))
+        vel_sum = np.zeros((n, 2))
+        neighbours = np.zeros(n)
+
+        protected_sq = self.protected_r ** 2
+        visual_sq = self.visual_r ** 2
+        for b0, b1, i, j in self.get_pair_batches(n, pairs_i, pairs_j):
+            bi = boids[i]
+            i = i - b0
+            m = b1 - b0
+            dx = self.pos[bi, 0] - self.pos[j, 0]
+            dy = self.pos[bi, 1] - self.pos[j, 1]
+            if self.wrap:
+                dx, dy = self.get_min_image(dx, dy)
+            dist_sq = dx * dx + dy * dy
+
+            # within protected
+            protected = dist_sq <= protected_sq
+            close[b0:b1, 0] = np.bincount(i, dx * protected, m)
+            close[b0:b1, 1] = np.bincount(i, dy * protected, m)
+
+            # outside protected but within visual range
+            visible = ~protected & (dist_sq <= visual_sq)
+            neighbours[b0:b1] = np.bincount(i, visible, m)
+            if self.wrap:
+                # neighbours across an edge count from where they appear, next to the boid
+                pos_sum[b0:b1, 0] = np.bincount(i, (self.pos[bi, 0] - dx) * visible, m)
+                pos_sum[b0:b1, 1] = np.bincount(i, (self.pos[bi, 1] - dy) * visible, m)
+            else:
+                pos_sum[b0:b1, 0] = np.bincount(i, self.pos[j, 0] * visible, m)
+                pos_sum[b0:b1, 1] = np.bincount(i, self.pos[j, 1] * visible, m)
+            vel_sum[b0:b1, 0] = np.bincount(i, self.vel[j, 0] * visible, m)
+            vel_sum[b0:b1, 1] = np.bincount(i, self.vel[j, 1] * visible, m)
+
+        return close, pos_sum, vel_sum, neighbours
+
+    # splits candidate pairs into batches of about pair_batch_size pairs, yielding (b0, b1, pairs_i, pairs_j) with
+    # the pairs of query boids [b0, b1). Every boid's pairs land in one batch in their original order, so its sums
+    # are one bincount whatever the batching (a worker stripe has fewer pairs than the whole flock, and splitting a
+    # boid's sum in different places would round differently)
+    def get_pair_batches(self, n, pairs_i, pairs_j):
+        if len(pairs_i) <= pair_batch_size:
+            yield 0, n, pairs_i, pairs_j
+            return
+        by_boid = np.argsort(pairs_i, kind='stable')
+        pairs_i = pairs_i[by_boid]
+        pairs_j = pairs_j[by_boid]
+        # first pair of every boid, and boid boundaries nearest each multiple of the batch size
+        first = np.searchsorted(pairs_i, np.arange(n + 1))
+        bounds = np.unique(np.searchsorted(first, np.arange(0, len(pairs_i), pair_batch_size), 'right') - 1)
+        bounds = np.append(bounds[bounds > 0], n)
+        b0 = 0
+        for b1 in bounds.tolist():
+            if b1 > b0:
+                yield b0, b1, pairs_i[first[b0]:first[b1]], pairs_j[first[b0]:first[b1]]
+            b0 = b1
+
+    # returns the flat ids (row * cells_width + column) of the occupied chunks (ascending) and the boid count (k,),
+    # position sum and velocity sum (k, 2) of each, so the summaries follow the number of boids rather than the area
+    # of the grid. Read from the chunks as binned when they hold the whole flock (serial updates), pool workers only
+    # bin their stripe so they group the flock's own chunk ids instead
+    def get_clusters(self):
+        chunks = self.chunks
+        if len(chunks.order) == self.size:
+            keys, start, end = chunks.get_occupied_spans()
+            count = end - start
+            # order lists each chunk's boids together in flock order, so the sums add up in the same order either way
+            ids = np.repeat(np.arange(len(keys)), count)
+            pos = self.pos[chunks.order]
+            vel = self.vel[chunks.order]
+        else:
+            cx, cy = self.get_cells(self.pos)
+            keys, ids, count = np.unique(cy.astype(np.int64) * chunks.cells_width + cx, return_inverse=True,
+                                         return_counts=True)
+            pos = self.pos
+            vel = self.vel
+        k = len(keys)
+        pos_sum = np.column_stack((np.bincount(ids, pos[:, 0], k), np.bincount(ids, pos[:, 1], k)))
+        vel_sum = np.column_stack((np.bincount(ids, vel[:, 0], k), np.bincount(ids, vel[:, 1], k)))
+        return keys, count, pos_sum, vel_sum
+
+    # far field of hierarchical flocks. Chunks in the cluster_range rings around each boid's 3x3 block are summarised
+    # (centroid, velocity sum, count), and every chunk whose centroid is in the boid's cluster visual range adds to
+    # its cohesion and alignment sums as if all its boids were at the centroid. Adds to pos_sum, vel_sum and
+    # neighbours (from get_neighbour_sums) in place
+    def add_cluster_sums(self, boids, pos_sum, vel_sum, neighbours):
+        keys, count, cluster_pos, cluster_vel = self.get_clusters()
+        last = len(keys) - 1
+        pos = self.pos[boids]
+        cx, cy = self.get_cells(pos)
+        cells_width = self.chunks.cells_width
+        cells_height = self.chunks.cells_height
+        # ring chunks are looked up once per chunk holding boids, in ascending order, which keeps the binary searches
+        # on the occupied chunk ids fast
+        blocks, boid_block = np.unique(cy * cells_width + cx, return_inverse=True)
+        by, bx = np.divmod(blocks, cells_width)
+        reach = self.cluster_range
+        range_sq = (self.chunks.cell_size * reach) ** 2  # circle covered by the rings wherever the boid is
+        for dy in range(-reach, reach + 1):
+            for dx in range(-reach, reach + 1):
+                if abs(dx) <= 1 and abs(dy) <= 1:
+                    continue  # near field, boids are evaluated individually
+                x = bx + dx
+                y = by + dy
+                if self.wrap:
+                    cells = (y % cells_height) * cells_width + x % cells_width
+                    ids = np.minimum(np.searchsorted(keys, cells), last)
+                    found = keys[ids] == cells
+                else:
+                    # off the grid chunks alias other chunks' ids, they are searched (keeping cells ascending) then
+                    # dropped
+                    cells = y * cells_width + x
+                    ids = np.minimum(np.searchsorted(keys, cells), last)
+                    found = (keys[ids] == cells) & (x >= 0) & (x < cells_width) & (y >= 0) & (y < cells_height)
+                members = (count[ids] * found)[boid_block]
+                ids = ids[boid_block]
+
+                offset = cluster_pos[ids] / np.maximum(members, 1)[:, None] - pos
+                if self.wrap:
+                    self.get_min_image(offset[:, 0], offset[:, 1])
+                seen = (members > 0) & ((offset ** 2).sum(axis=1) <= range_sq)
+                weight = members * seen
+                pos_sum += (pos + offset) * weight[:, None]
+                vel_sum += cluster_vel[ids] * seen[:, None]
+                neighbours += weight
+
+    # applies every rule to boids (flock indices) given their candidate neighbour pairs, and returns their next
+    # pos, vel and heading without modifying the flock. Only reads the current state so any subset of the flock can
+    # be stepped independently (and in any order) with the same result.
+    # predator_pos is an (m, 2) array of predator positions (or None) and steps (per boid) is how many ticks each
+    # update covers, None for 1
+    def steer(self, boids, pairs_i, pairs_j, wind, predator_pos=None, steps=None):
+        with profiler.scope('flock.neighbours'):
+            close, avg_pos, avg_vel, neighbours = self.get_neighbour_sums(boids, pairs_i, pairs_j)
+        if self.cluster_range > 0:
+            with profiler.scope('flock.clusters'):
+                self.add_cluster_sums(boids, avg_pos, avg_vel, neighbours)
+        with profiler.scope('flock.integration'):
+            return self.integrate(boids, close, avg_pos, avg_vel, neighbours, wind, predator_pos, steps)
+
+    # applies the rules to boids from their neighbour sums
+    def integrate(self, boids, close, avg_pos, avg_vel, neighbours, wind, predator_pos, steps=None):
+        pos = self.pos[boids]
+        vel = self.vel[boids]
+        if self.tick_scale != 1:
+            start_vel = vel.copy()
+
+        # - alignment and cohesion -
+        # boids with no neighbours keep zeroed averages, exactly like Boid.update
+        seen = neighbours > 0
+        avg_pos[seen] /= neighbours[seen, None]
+        avg_vel[seen] /= neighbours[seen, None]
+        vel += (avg_pos - pos) * self.centering_factor
+        vel += (avg_vel - vel) * self.matching_factor
+
+        # - steering away from other boids -
+        vel += close * self.turn_factor
+
+        # - steer away from predators -
+        if predator_pos is not None and len(predator_pos):
+            vel += self.get_escape(pos, predator_pos) * self.escape_factor
+
+        # - steer away from obstacles, harder the closer they are -
+        if self.obstacles is not None:
+            distance, gradient = self.obstacles.sample(pos)
+            near = distance < self.obstacle_margin
+            vel[near] += gradient[near] * ((self.obstacle_margin - distance[near]) / self.obstacle_margin *
+                                           self.avoid_factor)[:, None]
+
+        # - steer away from screen edges (wrapped worlds have none) -
+        if not self.wrap:
+            # left margin, else right margin
+            left = pos[:, 0] < self.screen_margin
+            vel[left, 0] += self.turn_factor
+            vel[~left & (pos[:, 0] > self.width - self.screen_margin), 0] -= self.turn_factor
+            # bottom margin, else top margin
+            bottom = pos[:, 1] > self.height - self.screen_margin
+            vel[bottom, 1] -= self.turn_factor
+            vel[~bottom & (pos[:, 1] < self.screen_margin), 1] += self.turn_factor
+
+        # steering is tuned per 60th of a second, scale it to the length of a tick
+        if self.tick_scale != 1:
+            vel -= start_vel
+            vel *= self.tick_scale
+            vel += start_vel
+
+        # - set speed within bounds -
+        # stationary boids are left alone rather than dividing by 0
+        speed = np.sqrt((vel ** 2).sum(axis=1))
+        cap = np.clip(speed, self.min_speed, self.max_speed)
+        moving = speed > 0
+        vel[moving] *= (cap[moving] / speed[moving])[:, None]
+
+        # - apply velocity and wind -
+        wind = np.asarray(wind, dtype=float)  # (x, y) for every boid or (len(boids), 2), one per boid
+        if steps is None and self.tick_scale == 1:
+            pos += vel
+            pos += wind
+        elif steps is None:
+            pos += (vel + wind) * self.tick_scale
+        else:
+            pos += (vel + wind) * (steps * self.tick_scale)[:, None]
+        if self.wrap:
+            pos[:, 0] %= self.width
+            pos[:, 1] %= self.height
+
+        # - calculate angle (for rendering) -
+        return pos, vel, np.arctan2(vel[:, 0], vel[:, 1])
+
+    # wind is an (x, y) for the whole flock or an (n, 2) array with every boid's wind.
+    # tick, lod_interval and view (x1, y1, x2, y2) give level of detail updates, boids outside view only update once
+    # lod_interval ticks have passed since their last update
+    def update(self, wind, predators=(), tick=0, lod_interval=1, view=None):
+        if self.size == 0:
+            return
+        predator_pos = np.array([p.get_pos() for p in predators], dtype=float).reshape(-1, 2)
+        with profiler.scope('flock.binning'):
+            cx, cy = self.get_chunks()
+            self.chunks.insert_coords(cx, cy)
+            if lod_interval > 1:
+                x1, y1, x2, y2 = view
+                x = self.pos[:, 0]
+                y = self.pos[:, 1]
+                due = ((tick - self.last_update >= lod_interval) |
+                       ((x >= x1) & (x < x2) & (y >= y1) & (y < y2)))
+                boids = self.all[due]
+                pairs_i, pairs_j = self.chunks.get_block_pairs(cx[boids], cy[boids])
+            else:
+                pairs_i, pairs_j = self.chunks.get_block_pairs(cx, cy)
+
+        if lod_interval > 1:
+            steps = (tick - self.last_update[boids]).astype(float)
+            if np.ndim(wind) == 2:
+                wind = wind[boids]
+            self.pos[boids], self.vel[boids], self.heading[boids] = self.steer(boids, pairs_i, pairs_j, wind,
+                                                                               predator_pos, steps)
+            self.last_update[boids] = tick
+        else:
+            self.pos[:], self.vel[:], self.heading[:] = self.steer(self.all, pairs_i, pairs_j, wind, predator_pos)
@@ -1,63 +1,330 @@
 import pygame
-from random import randint
+import random
 import math
-from support import get_distance, lerp1D
+from itertools import repeat
+import numpy as np
+from support import lerp1D
+from boid_arrays import BoidArrays
+from spatial_hash import SpatialHash, SparseSpatialHash
+from flock_pool import FlockPool
+from profiler import profiler
+from flock_stats import FlockStats
+from render import draw_triangles, get_radius, get_rects, get_in_view, SpriteAtlas
+from rng import RandomStreams, get_random_positions
+from recorder import TrajectoryRecorder
+from wind import WindField
 
 minute = 60 * 60  # 60fps * 60 seconds
 
 
+# backend 'objects' updates a python Boid per agent, 'numpy' stores the whole flock in BoidArrays (for large flocks).
+# workers > 0 updates a numpy flock on that many processes (call close() when done with the flock).
+# synchronous double buffers object boids so every boid reads last frame's state and results don't depend on update
+# order (the numpy backend is always synchronous).
+# sprites draws boids and predators from atlases of pre-rotated sprites (one per heading bin) with Surface.blits.
+# lod_interval > 1 only updates boids outside the view (self.view) every lod_interval ticks, each update moving them
+# as far as the ticks it covers. Boids in view update every tick.
+# world_size (width, height) gives the flock its own world, which can be many screens across, instead of flying over
+# the surface. The chunk grid only stores occupied chunks and the flock is drawn from its view (see scroll).
+# wrap makes the world toroidal, boids fly off one edge onto the opposite one and see neighbours across edges, with no
+# edge steering (uniform density, no edge effects). numpy backend only.
+# use_predator hunts the flock with a number of predators (predators). Boids only check predators in the chunks around them.
+# predator_targeting 'flock' sends attacking predators at the centre of the whole flock, 'local' at the centre of the
+# boids in the chunks around them (or around the nearest occupied chunk if there are none).
+# rng is a RandomStreams the flock draws its layout, wind and predators from (seed it for reproducible runs).
+# wind_field adds wind that varies over the world and with time (see WindField) to the flock-wide wind (use_wind).
+# obstacles is a DistanceField (e.g. of a level's collideable tiles) the boids steer around.
+# cluster_range >= 2 makes the flock hierarchical (numpy backend only): boids in the 3x3 chunks around a boid are still
+# felt one by one, and chunks in that many rings further out are felt through a summary of each (centroid, mean
+# velocity and boid count), widening cohesion and alignment to cluster_range chunks at a fixed cost per ring chunk
+# however many boids it holds.
+# tick_rate is how many updates make a second of sim time. Speeds, steering and timers are tuned for 60 updates a
+# second and each update covers 60 / tick_rate of those 60ths, so higher rates step the same motion more finely
 class Flock:
-    def __init__(self, surface, flock_size, use_predator=False, use_wind=False):
+    def __init__(self, surface, flock_size, use_predator=False, use_wind=False, backend='objects', workers=0,
+                 synchronous=False, sprites=False, lod_interval=1, world_size=None, wrap=False, predators=1,
+                 predator_targeting='flock', rng=None, wind_field=False, obstacles=None, cluster_range=0,
+                 tick_rate=60):
         self.surface = surface
+        self.rng = rng if rng is not None else RandomStreams()
+        self.world_size = tuple(world_size) if world_size is not None else self.surface.get_size()
         self.chunk_size = 80
-        # chunks height and width include 2 buffer chunks as a margin beyond screen view
-        self.chunks_width = self.surface.get_width() // self.chunk_size + 2  # number of chunks horizontally
-        self.chunks_height = self.surface.get_height() // self.chunk_size + 2  # number of chunks vertically
-        self.chunks = {}
-        # loop from -1 to 1 less than chunk width/height (due to nature of range function)
-        for y in range(-1, self.chunks_height):
-            for x in range(-1, self.chunks_width):
-                self.chunks[(x, y)] = []
-
-        self.boids = [Boid(self.surface) for b in range(flock_size)]
+        # chunks height and width include 2 buffer chunks as a margin beyond the world
+        self.chunks_width = self.world_size[0] // self.chunk_size + 2  # number of chunks horizontally
+        self.chunks_height = self.world_size[1] // self.chunk_size + 2  # number of chunks vertically
+        self.wrap = wrap
+        if wrap:
+            if backend != 'numpy':
+                raise ValueError("wrap-around worlds require backend='numpy'")
+            if workers > 0:
+                raise ValueError("wrap-around worlds require workers=0")
+            # no margin, the grid is whole chunks wrapping round the world (see BoidArrays.get_wrapped_chunks)
+            self.chunks_width = max(self.world_size[0] // self.chunk_size, 1)
+            self.chunks_height = max(self.world_size[1] // self.chunk_size, 1)
+            grid = SparseSpatialHash if world_size is not None else SpatialHash
+            self.chunks = grid(self.chunk_size, self.chunks_width, self.chunks_height, (0, 0), True)
+        # grid starts at chunk -1 (the margin), so chunk (x, y) is cell (x + 1, y + 1)
+        elif world_size is not None:
+            if backend != 'numpy':
+                raise ValueError("flock worlds require backend='numpy'")
+            self.chunks = SparseSpatialHash(self.chunk_size, self.chunks_width, self.chunks_height,
+                                            (-self.chunk_size, -self.chunk_size))
+        else:
+            self.chunks = SpatialHash(self.chunk_size, self.chunks_width, self.chunks_height,
+                                      (-self.chunk_size, -self.chunk_size))
+
+        self.backend = backend
+        self.obstacles = obstacles
+        self.tick_scale = 60 / tick_rate  # 60ths of a second per update
+        self.synchronous = synchronous
+        if self.backend == 'objects':
+            layout = get_random_positions(self.rng.get_array('flock.layout'), flock_size, *self.world_size)
+            self.boids = [Boid(self.surface, pos=pos) for pos in layout.tolist()]
+            self.boid_chunks = [0] * flock_size  # flat chunk id of each boid, reused every frame
+            self.sorted_boids = []  # boids ordered by chunk (matches self.chunks.order)
+            self.sorted_states = []  # (pos, vel) of sorted_boids
+            self.neighbours = []  # (pos, vel) of boids in the 3x3 chunk block being updated
+        elif self.backend == 'numpy':
+            self.boids = BoidArrays(self.surface, flock_size, self.chunks, self.world_size,
+                                    self.rng.get_array('flock.layout'))
+            self.boids.obstacles = obstacles  # before the pool copies the flock to its workers
+            self.boids.cluster_range = cluster_range
+            self.boids.tick_scale = self.tick_scale
+        else:
+            raise ValueError(f"unknown flock backend '{backend}'")
+
+        if cluster_range > 0 and self.backend != 'numpy':
+            raise ValueError("hierarchical flocks require backend='numpy'")
+        if cluster_range == 1:
+            # the one ring around a boid is its 3x3 block, which it already feels boid by boid
+            raise ValueError("cluster_range must be 0 or at least 2")
+        if cluster_range > 0 and wrap and min(self.chunks_width, self.chunks_height) < cluster_range * 2 + 1:
+            # the rings would wrap round onto chunks already counted
+            raise ValueError(f"cluster_range {cluster_range} needs a wrapped world at least {cluster_range * 2 + 1} "
+                             f"chunks across")
+        if workers > 0 and self.backend != 'numpy':
+            raise ValueError("parallel flock updates require backend='numpy'")
+        if workers > 0 and lod_interval > 1:
+            raise ValueError("level of detail updates require workers=0")
+        if predator_targeting not in ('flock', 'local'):
+            raise ValueError(f"unknown predator targeting '{predator_targeting}'")
+        self.pool = FlockPool(self.boids, workers) if workers > 0 else None
 
         self.use_predator = use_predator
-        if self.use_predator:
-            self.predator = BoidPredator(self.surface)
+        predator_rng = self.rng.get('flock.predators')
+        self.predators = [BoidPredator(self.surface, self.world_size, predator_rng, wrap)
+                          for p in range(predators if use_predator else 0)]
+        self.jitter_rng = self.rng.get_array('flock.predators.jitter')  # circling randomness, drawn once per tick
+        self.predator_targeting = predator_targeting
+        if self.backend == 'objects':
+            # predators binned in the same chunks as the boids (the numpy backend bins its own, see BoidArrays)
+            self.predator_chunks = SpatialHash(self.chunk_size, self.chunks_width, self.chunks_height,
+                                               (-self.chunk_size, -self.chunk_size))
+            self.predator_cells = []
+            self.sorted_predator_pos = []  # predator positions ordered by chunk (matches self.predator_chunks.order)
+
+        if sprites:
+            self.boid_atlas = SpriteAtlas(self.surface, 6, 2, "red")
+            self.predator_atlas = SpriteAtlas(self.surface, 12, 4, "orange")
         else:
-            self.predator = None
+            self.boid_atlas = None
+            self.predator_atlas = None
 
         self.max_wind = 3
         self.min_wind_change = int(minute * 0.1)
         self.max_wind_change = int(minute * 0.2)
         self.wind_transition = 60
-        self.wind_change = randint(self.min_wind_change, self.max_wind_change)
+        self.wind_rng = self.rng.get('flock.wind')
+        self.wind_change = self.wind_rng.randint(self.min_wind_change, self.max_wind_change)
+        # - level of detail -
+        self.lod_interval = lod_interval
+        self.view = self.surface.get_rect()  # area of the world that is seen (drawn to the surface)
+        self.drawn_view = self.view.copy()  # view at the last draw
+        self.view_moved = False  # view scrolled between the last two draws, so everything drawn moved
+        self.lod_margin = get_radius(6, 2)  # boids this close to the view can still be seen (triangle size)
+        self.tick = 0
+        # stagger boids so the reduced updates are spread evenly over the ticks
+        if self.backend == 'numpy':
+            self.boids.last_update[:] = -(self.boids.all % lod_interval)
+        else:
+            for i, b in enumerate(self.boids):
+                b.last_update = -(i % lod_interval)
+
         self.use_wind = use_wind
         self.wind = [0, 0]
         self.new_wind = [0.0, 0.0]  # wind for next transition
+        if wind_field:
+            self.wind_field = WindField(self.world_size, self.wrap, self.rng.get_array('flock.wind.field'))
+        else:
+            self.wind_field = None
+        self.sorted_winds = []  # wind at each of sorted_boids (object backend with a wind field)
+
+        self.recorder = None  # TrajectoryRecorder while recording (see start_recording)
+
+        # centroid, mean velocity and bounding box of the boids as they were at the start of the last update (what
+        # its predators steered by), for both backends
+        self.stats = FlockStats()
+        self.update_stats()
+
+        # interpolate draws boids between their last two positions (for fixed timestep updates, see Level.update)
+        self.interpolate = False
+        self.previous_pos = None  # positions before the last update
+        self.previous_predator_pos = None
+        self.drawn_pos = np.zeros((0, 2))  # positions last drawn at
+        self.drawn_predator_pos = np.zeros((0, 2))
 
     def update(self):
+        if self.interpolate:
+            self.store_previous()
+
         if self.use_wind:
-            self.wind_change -= 1
+            self.wind_change -= self.tick_scale
             # lerp wind to new wind if in transitional period
             if -self.wind_transition <= self.wind_change < 0:
                 self.wind[0] = lerp1D(self.wind[0], self.new_wind[0], abs(self.wind_change) / self.wind_transition)
                 self.wind[1] = lerp1D(self.wind[1], self.new_wind[1], abs(self.wind_change) / self.wind_transition)
             # set new wind for next transition if transition is completed
             elif self.wind_change < -self.wind_transition:
-                self.new_wind[0] = randint(-self.max_wind * 100, self.max_wind * 100) / 100
-                self.new_wind[1] = randint(-self.max_wind * 100, self.max_wind * 100) / 100
-                self.wind_change = randint(self.min_wind_change, self.max_wind_change)
-
-        # update predator
-        if self.use_predator:
-            self.predator.update(self.boids, self.wind)
-
-        # first update chunks (reset so empty)
-        for chunk in self.chunks.keys():
-            self.chunks[chunk] = []
-        # update boids by chunk
-        for b in self.boids:
+                self.new_wind[0] = self.wind_rng.randint(-self.max_wind * 100, self.max_wind * 100) / 100
+                self.new_wind[1] = self.wind_rng.randint(-self.max_wind * 100, self.max_wind * 100) / 100
+                self.wind_change = self.wind_rng.randint(self.min_wind_change, self.max_wind_change)
+        if self.wind_field is not None:
+            self.wind_field.update(self.tick_scale)
+
+        # stats the predators steer by, object flocks sum them while binning
+        if self.backend == 'objects':
+            with profiler.scope('flock.binning'):
+                self.bin_boids()
+        else:
+            with profiler.scope('flock.stats'):
+                self.update_stats()
+
+        # update predators
+        if self.predators:
+            with profiler.scope('flock.predator'):
+                jitter = (self.jitter_rng.randint(5, 11, (len(self.predators), 2)) / 10).tolist()
+                if self.wind_field is not None:
+                    winds = self.get_winds(self.get_predator_positions()).tolist()
+                else:
+                    winds = repeat(self.wind)
+                for predator, target, j, wind in zip(self.predators, self.get_predator_targets(), jitter, winds):
+                    predator.update(self.stats, wind, target, j, self.tick_scale)
+
+        self.tick += 1
+        if self.backend == 'numpy':
+            # every boid's wind in one batched lookup
+            wind = self.get_winds(self.boids.pos) if self.wind_field is not None else self.wind
+            if self.pool is not None:
+                self.pool.update(wind, self.predators)
+            elif self.lod_interval > 1:
+                self.boids.update(wind, self.predators, self.tick, self.lod_interval, self.get_lod_view())
+            else:
+                self.boids.update(wind, self.predators)
+        else:
+            if self.predators:
+                with profiler.scope('flock.binning'):
+                    self.bin_predators()
+            # neighbour pass and integration happen together in Boid.update
+            with profiler.scope('flock.boids'):
+                self.update_boids()
+
+        if self.recorder is not None:
+            with profiler.scope('flock.record'):
+                self.recorder.record(self.tick, *self.get_states())
+
+    # refreshes the stats from the flock as it is now (updates refresh them before moving the flock)
+    def update_stats(self):
+        # summed over the whole flock in one place (not per worker stripe) so parallel updates stay identical for
+        # any worker count
+        if self.backend == 'numpy':
+            self.stats.set_arrays(self.boids.pos, self.boids.vel, self.world_size if self.wrap else None)
+        else:
+            self.bin_boids()
+
+    # returns the wind (n, 2) at positions pos (n, 2), the flock-wide wind plus the wind field
+    def get_winds(self, pos):
+        winds = self.wind_field.sample(pos)
+        winds += self.wind
+        return winds
+
+    # returns (m, 2) array of predator positions
+    def get_predator_positions(self):
+        return np.array([p.pos for p in self.predators], dtype=float).reshape(-1, 2)
+
+    # returns where each predator aims when attacking, None for the centre of the flock (see predator_targeting).
+    # Local centres come from the chunks binned this update (object flocks bin before their predators move), from
+    # around the nearest occupied chunk for predators with no boids nearby
+    def get_predator_targets(self):
+        if self.predator_targeting == 'flock':
+            return [None] * len(self.predators)
+        if self.backend == 'numpy':
+            return self.boids.get_local_centres(self.get_predator_positions())
+
+        targets = []
+        occupied = None
+        for p in self.predators:
+            c = self.get_chunk(*p.pos)
+            target = self.get_block_centre(c)
+            # no boids nearby, look around the nearest occupied chunk instead
+            if target is None and self.boids:
+                if occupied is None:
+                    occupied = self.chunks.get_occupied().tolist()
+                cy, cx = divmod(c, self.chunks_width)
+                target = self.get_block_centre(min(occupied, key=lambda o: (o % self.chunks_width - cx) ** 2 +
+                                                                            (o // self.chunks_width - cy) ** 2))
+            targets.append(target)
+        return targets
+
+    # returns the centre of the boids in the 3x3 chunks around chunk c, None if there are none
+    def get_block_centre(self, c):
+        x_sum = y_sum = count = 0
+        for start, end in self.chunks.get_block_ranges(c):
+            for bpos, bvel in self.sorted_states[start:end]:
+                x_sum += bpos[0]
+                y_sum += bpos[1]
+                count += 1
+        return [x_sum / count, y_sum / count] if count else None
+
+    # moves the view by a camera scroll value ([x, y] world pixels, e.g. from Camera.get_scroll), kept inside the
+    # world
+    def scroll(self, scroll_value):
+        self.view = self.view.move(round(scroll_value[0]), round(scroll_value[1]))
+        self.view.clamp_ip(pygame.Rect((0, 0), self.world_size))
+
+    # returns the area boids always update in (x1, y1, x2, y2), the view plus the size of a boid
+    def get_lod_view(self):
+        view = self.view.inflate(self.lod_margin * 2, self.lod_margin * 2)
+        return view.left, view.top, view.right, view.bottom
+
+    # -- object backend --
+
+    # returns the flat chunk id of a position, clipped into the chunk area (for agents that aren't clamped into it)
+    def get_chunk(self, x, y):
+        x = min(max(int(x // self.chunk_size), -1), self.chunks_width - 2)
+        y = min(max(int(y // self.chunk_size), -1), self.chunks_height - 2)
+        return (y + 1) * self.chunks_width + x + 1
+
+    # bins predators into chunks
+    def bin_predators(self):
+        self.predator_cells[:] = [self.get_chunk(*p.pos) for p in self.predators]
+        self.predator_chunks.insert(self.predator_cells)
+        self.sorted_predator_pos[:] = [self.predators[i].pos for i in self.predator_chunks.order.tolist()]
+
+    # returns the positions of predators in the 3x3 chunks around chunk c
+    def get_near_predators(self, c):
+        if not self.predators:
+            return ()
+        near = []
+        for start, end in self.predator_chunks.get_block_ranges(c):
+            near += self.sorted_predator_pos[start:end]
+        return near
+
+    # bins boids into chunks, summing the flock's stats on the way
+    def bin_boids(self):
+        x_sum = y_sum = vx_sum = vy_sum = 0
+        x1 = y1 = float('inf')
+        x2 = y2 = float('-inf')
+        for i, b in enumerate(self.boids):
             pos = b.get_pos()
             # find boid chunk index
             y = int(pos[1] // self.chunk_size)
@@ -82,46 +349,194 @@ class Flock:
             elif x > self.chunks_width - 2:
                 b.set_pos(((self.chunks_width - 1) * self.chunk_size, pos[1]))
                 x = self.chunks_width - 2
-            self.chunks[(x, y)].append(b)
-
-        # x, y
-        neighbour_chunks = [[-1, -1], [0, -1], [1, -1],
-                            [-1, 0],  [0, 0],  [1, 0],
-                            [-1, 1],  [0, 1],  [1, 1]]
-        for c in self.chunks.keys():
-            # only do chunk checks for chunks that are not empty
-            if len(self.chunks[c]) > 0:
-                # collect neighbouring boids for chunk
-                neighbours = []
-                for n in neighbour_chunks:
-                    # ensure chunk is within range
-                    if 0 <= c[1] + n[1] < self.chunks_height and 0 <= c[0] + n[0] < self.chunks_width:
-                        ny = c[1] + n[1]
-                        nx = c[0] + n[0]
-                        neighbours += self.chunks[(nx, ny)]
-                # update boids in chunk using neighbour list
-                for b in self.chunks[c]:
-                    b.update(neighbours, self.wind, self.predator)
-
-    def draw(self):
-        for b in self.boids:
-            b.draw()
-        if self.use_predator:
-            self.predator.draw()
+            self.boid_chunks[i] = (y + 1) * self.chunks_width + x + 1
+
+            px, py = b.pos
+            vx, vy = b.vel
+            x_sum += px
+            y_sum += py
+            vx_sum += vx
+            vy_sum += vy
+            if px < x1:
+                x1 = px
+            if px > x2:
+                x2 = px
+            if py < y1:
+                y1 = py
+            if py > y2:
+                y2 = py
+        self.stats.set(len(self.boids), (x_sum, y_sum), (vx_sum, vy_sum), (x1, y1, x2, y2))
+        self.chunks.insert(self.boid_chunks)
+        # the sorted lists keep their list objects but are refilled every frame (order goes through a python list)
+        self.sorted_boids[:] = map(self.boids.__getitem__, self.chunks.order.tolist())
+        self.sorted_states[:] = [b.state for b in self.sorted_boids]
+        if self.wind_field is not None:
+            pos = np.array([pos for pos, vel in self.sorted_states], dtype=float).reshape(-1, 2)
+            self.sorted_winds[:] = self.get_winds(pos).tolist()
+
+    # returns the wind of sorted boids [start, end)
+    def get_sorted_winds(self, start, end):
+        if self.wind_field is not None:
+            return self.sorted_winds[start:end]
+        return repeat(self.wind, end - start)
+
+    # updates boids chunk by chunk
+    def update_boids(self):
+        if self.lod_interval > 1:
+            self.update_boids_lod()
+            return
+
+        # only do chunk checks for chunks that are not empty
+        neighbours = self.neighbours
+        cell_start = self.chunks.cell_start
+        for c in self.chunks.get_occupied().tolist():
+            # collect neighbouring boids for chunk (3 contiguous row slices of the sorted boids)
+            neighbours.clear()
+            for start, end in self.chunks.get_block_ranges(c):
+                neighbours.extend(self.sorted_states[start:end])
+            predators = self.get_near_predators(c)
+            # update boids in chunk using neighbour list
+            start, end = cell_start[c], cell_start[c + 1]
+            for b, wind in zip(self.sorted_boids[start:end], self.get_sorted_winds(start, end)):
+                b.update(neighbours, wind, predators, self.synchronous, 1, self.obstacles, self.tick_scale)
+
+        # swap front and back buffers now every boid has read the front
+        if self.synchronous:
+            for b in self.boids:
+                b.swap()
+
+    # update_boids with level of detail, boids outside the view wait until lod_interval ticks since their last update
+    def update_boids_lod(self):
+        tick = self.tick
+        interval = self.lod_interval
+        x1, y1, x2, y2 = self.get_lod_view()
+        updated = []
+        neighbours = self.neighbours
+        cell_start = self.chunks.cell_start
+        for c in self.chunks.get_occupied().tolist():
+            due = []
+            start, end = cell_start[c], cell_start[c + 1]
+            for b, wind in zip(self.sorted_boids[start:end], self.get_sorted_winds(start, end)):
+                x, y = b.pos
+                if tick - b.last_update >= interval or (x1 <= x < x2 and y1 <= y < y2):
+                    due.append((b, wind))
+            if not due:
+                continue
+            neighbours.clear()
+            for start, end in self.chunks.get_block_ranges(c):
+                neighbours.extend(self.sorted_states[start:end])
+            predators = self.get_near_predators(c)
+            for b, wind in due:
+                b.update(neighbours, wind, predators, self.synchronous, tick - b.last_update, self.obstacles,
+                         self.tick_scale)
+                b.last_update = tick
+                updated.append(b)
+
+        # boids that didn't update have nothing in their back buffer
+        if self.synchronous:
+            for b in updated:
+                b.swap()
+
+    # shuts down the worker processes of a parallel flock
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        self.stop_recording()
+
+    # streams every boid's position and velocity after each update to a trajectory file at path (see recorder)
+    def start_recording(self, path, frames_per_chunk=64):
+        self.stop_recording()
+        self.recorder = TrajectoryRecorder(path, len(self.boids), self.world_size, self.wrap, frames_per_chunk)
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder = self.recorder
+            self.recorder = None  # even if closing raises a write error
+            recorder.close()
+
+    # returns (pos, vel) arrays (n, 2) of every boid
+    def get_states(self):
+        if self.backend == 'numpy':
+            return self.boids.pos, self.boids.vel
+        pos = np.array([b.pos for b in self.boids], dtype=float).reshape(-1, 2)
+        vel = np.array([b.vel for b in self.boids], dtype=float).reshape(-1, 2)
+        return pos, vel
+
+    # keeps positions from before this tick so draw can blend between the last two ticks
+    def store_previous(self):
+        self.previous_pos = np.array(self.get_states()[0])
+        self.previous_predator_pos = self.get_predator_positions()
+
+    # returns rects covering everything draw() drew this frame (for dirty rect rendering), None if the view scrolled
+    # (everything on screen moved)
+    def get_rects(self):
+        if self.view_moved:
+            return None
+        return get_rects(self.drawn_pos, get_radius(6, 2)) + get_rects(self.drawn_predator_pos, get_radius(12, 4))
+
+    # alpha is how far between the last two ticks to draw the flock (0 last tick, 1 this tick), used if interpolate
+    def draw(self, alpha=1):
+        with profiler.scope('flock.draw'):
+            pos, vel = self.get_states()
+            predator_pos = self.get_predator_positions()
+            predator_vel = np.array([p.vel for p in self.predators], dtype=float).reshape(-1, 2)
+            if self.interpolate and self.previous_pos is not None:
+                if self.wrap:
+                    # boids that wrapped last tick blend along the short way, across the edge
+                    moved = pos - self.previous_pos
+                    self.boids.get_min_image(moved[:, 0], moved[:, 1])
+                    pos = (self.previous_pos + moved * alpha) % self.world_size
+                else:
+                    pos = self.previous_pos + (pos - self.previous_pos) * alpha
+                predator_pos = self.previous_predator_pos + (predator_pos - self.previous_predator_pos) * alpha
+
+            # world to surface coordinates, only boids in view are drawn
+            if self.view.topleft != (0, 0) or self.view.size != self.world_size:
+                seen = get_in_view(pos, self.view, self.lod_margin)
+                pos = pos[seen] - self.view.topleft
+                vel = vel[seen]
+                predator_pos = predator_pos - self.view.topleft
+            self.drawn_pos = pos
+            self.drawn_predator_pos = predator_pos
+            self.view_moved = self.view != self.drawn_view
+            self.drawn_view = self.view.copy()
+
+            # every boid's triangle is drawn in one batch, Boid.draw is only for drawing a single boid
+            if self.boid_atlas is not None:
+                self.boid_atlas.draw(pos, vel)
+            else:
+                draw_triangles(self.surface, pos, vel, 6, 2, "red")
+
+            if self.predator_atlas is not None:
+                self.predator_atlas.draw(predator_pos, predator_vel)
+            else:
+                draw_triangles(self.surface, predator_pos, predator_vel, 12, 4, "orange")
 
 
 class Boid:
-    def __init__(self, surface):
+    # rng (random or a random.Random) places the boid if pos isn't given
+    def __init__(self, surface, rng=random, pos=None):
         self.surface = surface
         self.rot_deg = 0
 
-        self.pos = [randint(0, surface.get_width()), randint(0, surface.get_height())]  # x, y
+        if pos is None:
+            pos = [rng.randint(0, surface.get_width()), rng.randint(0, surface.get_height())]
+        self.pos = list(pos)  # x, y
         self.vel = [0, 0]  # x, y
+        # pos and vel are only ever modified in place, so this stays valid. Neighbours read it instead of the boid
+        self.state = (self.pos, self.vel)
+        # back buffer for synchronous updates, swapped with state once every boid has updated
+        self.next_state = ([0, 0], [0, 0])
+        self.last_update = 0  # tick of the boid's last update (see Flock lod_interval)
         self.min_speed = 1
         self.max_speed = 5  # 3 or 5
 
         self.protected_r = 10  # protected distance to steer away from other boids
         self.visual_r = 80  # 50 distance boid can see other boids  MUST BE LESS THAN CHUNK SIZE
+        # squared radii, distances are compared squared to avoid a sqrt per neighbour
+        self.protected_sq = self.protected_r ** 2
+        self.visual_sq = self.visual_r ** 2
 
         self.turn_factor = 0.1   # 0.1 or 0.05 amount boid turns (multiplier)
         self.screen_margin = 200  # 200 margin from screen edge before turning
@@ -129,6 +544,8 @@ class Boid:
         self.matching_factor = 0.05  # loose 0.02 or 0.05 tight, tend towards average velocity (multiplier)
         self.centering_factor = 0.005  # 0.005 0.001 tend towards center of visual flock (multiplier)
         self.escape_factor = 0.2  # factor boids attempt to escape predator (multiplier)
+        self.obstacle_margin = 40  # distance from obstacles before turning
+        self.avoid_factor = 1  # amount boid turns at an obstacle's surface, less further away (multiplier)
 
     def get_pos(self):
         return self.pos
@@ -144,7 +561,13 @@ class Boid:
         self.vel[0] = vel[0]
         self.vel[1] = vel[1]
 
-    def update(self, boids, wind, predator=None):
+    # boids is a sequence of (pos, vel) boid states (Boid.state), most of which are usually outside visual range.
+    # synchronous writes the result to next_state rather than state, call swap() once the whole flock has updated.
+    # predators is a sequence of [x, y] predator positions, those near enough are escaped from.
+    # step is how many ticks the update covers (level of detail updates move boids several ticks at once).
+    # obstacles is a DistanceField to steer around.
+    # tick_scale is how many 60ths of a second a tick is (the rules are tuned for 60 ticks a second)
+    def update(self, boids, wind, predators=(), synchronous=False, step=1, obstacles=None, tick_scale=1):
         # steering
         close_dx = 0
         close_dy = 0
@@ -155,17 +578,28 @@ class Boid:
         avg_y_vel = 0
         neighbours = 0
 
+        # locals so the loop does no attribute lookups
+        x, y = self.pos
+        visual_r = self.visual_r
+        protected_sq = self.protected_sq
+        visual_sq = self.visual_sq
+
         # loop through all other boids in flock
-        for b in boids:
-            bpos = b.get_pos()
-            bvel = b.get_vel()
-            dist = get_distance(self.pos, bpos)
+        for bpos, bvel in boids:
+            # reject boids outside the visual square before doing any more maths
+            dx = x - bpos[0]
+            if not -visual_r <= dx <= visual_r:
+                continue
+            dy = y - bpos[1]
+            if not -visual_r <= dy <= visual_r:
+                continue
+            dist_sq = dx * dx + dy * dy
             # within protected
-            if dist <= self.protected_r:
-                close_dx += self.pos[0] - bpos[0]
-                close_dy += self.pos[1] - bpos[1]
+            if dist_sq <= protected_sq:
+                close_dx += dx
+                close_dy += dy
             # outside protected but within visual range
-            elif dist <= self.visual_r:
+            elif dist_sq <= visual_sq:
                 # accumulate averages and total neighbours
                 neighbours += 1
                 avg_x_pos += bpos[0]
@@ -182,55 +616,87 @@ class Boid:
             avg_y_pos /= neighbours
             avg_x_vel /= neighbours
             avg_y_vel /= neighbours
+        # synchronous updates write to the back buffer so neighbours still read this frame's state
+        if synchronous:
+            pos, vel = self.next_state
+            vel[0] = self.vel[0]
+            vel[1] = self.vel[1]
+        else:
+            pos = self.pos
+            vel = self.vel
+        start_x_vel, start_y_vel = vel
+
         # apply avg pos to vel
-        self.vel[0] += (avg_x_pos - self.pos[0]) * self.centering_factor
-        self.vel[1] += (avg_y_pos - self.pos[1]) * self.centering_factor
+        vel[0] += (avg_x_pos - self.pos[0]) * self.centering_factor
+        vel[1] += (avg_y_pos - self.pos[1]) * self.centering_factor
         # apply avg vels (difference between vels and multiply by match factor multiplier)
-        self.vel[0] += (avg_x_vel - self.vel[0]) * self.matching_factor
-        self.vel[1] += (avg_y_vel - self.vel[1]) * self.matching_factor
+        vel[0] += (avg_x_vel - vel[0]) * self.matching_factor
+        vel[1] += (avg_y_vel - vel[1]) * self.matching_factor
 
         # - steering away from other boids -
-        self.vel[0] += close_dx * self.turn_factor
-        self.vel[1] += close_dy * self.turn_factor
-
-        # - steer away from predator -
-        if predator is not None:
-            pred_pos = predator.get_pos()
-            if get_distance(self.pos, pred_pos) <= self.visual_r:
-                self.vel[0] += (self.pos[0] - pred_pos[0]) * self.escape_factor
-                self.vel[1] += (self.pos[1] - pred_pos[1]) * self.escape_factor
+        vel[0] += close_dx * self.turn_factor
+        vel[1] += close_dy * self.turn_factor
+
+        # - steer away from predators -
+        for pred_pos in predators:
+            if (x - pred_pos[0]) ** 2 + (y - pred_pos[1]) ** 2 <= visual_sq:
+                vel[0] += (self.pos[0] - pred_pos[0]) * self.escape_factor
+                vel[1] += (self.pos[1] - pred_pos[1]) * self.escape_factor
+
+        # - steer away from obstacles, harder the closer they are -
+        if obstacles is not None:
+            distance, gradient_x, gradient_y = obstacles.sample_one(x, y)
+            if distance < self.obstacle_margin:
+                push = (self.obstacle_margin - distance) / self.obstacle_margin * self.avoid_factor
+                vel[0] += gradient_x * push
+                vel[1] += gradient_y * push
 
         # - steer away from screen edges -
         # left margin
         if self.pos[0] < self.screen_margin:
-            self.vel[0] += self.turn_factor
+            vel[0] += self.turn_factor
         # right margin
         elif self.pos[0] > self.surface.get_width() - self.screen_margin:
-            self.vel[0] -= self.turn_factor
+            vel[0] -= self.turn_factor
         # bottom margin
         if self.pos[1] > self.surface.get_height() - self.screen_margin:
-            self.vel[1] -= self.turn_factor
+            vel[1] -= self.turn_factor
         # top margin
         elif self.pos[1] < self.screen_margin:
-            self.vel[1] += self.turn_factor
+            vel[1] += self.turn_factor
+
+        # steering is tuned per 60th of a second, scale it to the length of a tick
+        if tick_scale != 1:
+            vel[0] = start_x_vel + (vel[0] - start_x_vel) * tick_scale
+            vel[1] = start_y_vel + (vel[1] - start_y_vel) * tick_scale
+            step *= tick_scale
 
         # - set speed within bounds -
-        speed = math.sqrt(self.vel[0]**2 + self.vel[1]**2)
+        speed = math.sqrt(vel[0]**2 + vel[1]**2)
         # find fraction of speed each vel component makes up then multiply to cap at max or min speed
         if speed > self.max_speed:
-            self.vel[0] = (self.vel[0] / speed) * self.max_speed
-            self.vel[1] = (self.vel[1] / speed) * self.max_speed
+            vel[0] = (vel[0] / speed) * self.max_speed
+            vel[1] = (vel[1] / speed) * self.max_speed
         elif speed < self.min_speed:
-            self.vel[0] = (self.vel[0] / speed) * self.min_speed
-            self.vel[1] = (self.vel[1] / speed) * self.min_speed
+            vel[0] = (vel[0] / speed) * self.min_speed
+            vel[1] = (vel[1] / speed) * self.min_speed
 
         # - apply velocity and wind -
         # wind is separate force to boid velocity (external force)
-        self.pos[0] += self.vel[0] + wind[0]
-        self.pos[1] += self.vel[1] + wind[1]
+        if step == 1:
+            pos[0] = x + vel[0] + wind[0]
+            pos[1] = y + vel[1] + wind[1]
+        else:
+            pos[0] = x + (vel[0] + wind[0]) * step
+            pos[1] = y + (vel[1] + wind[1]) * step
 
         # - calculate angle (for rendering) -
-        self.rot_deg = math.degrees(math.atan2(self.vel[0], self.vel[1]))
+        self.rot_deg = math.degrees(math.atan2(vel[0], vel[1]))
+
+    # makes the back buffer written by a synchronous update the current state
+    def swap(self):
+        self.state, self.next_state = self.next_state, self.state
+        self.pos, self.vel = self.state
 
     def draw(self):
         point_ahead = 6
@@ -250,11 +716,18 @@ class Boid:
 
 
 class BoidPredator:
-    def __init__(self, surface):
+    # rng is the random or random.Random the predator draws its spawn, attack timings and circling points from.
+    # wrap makes its world toroidal like a wrapped flock's, no edges to steer away from and targets are reached the
+    # short way, across an edge if that is nearer
+    def __init__(self, surface, world_size=None, rng=random, wrap=False):
         self.surface = surface
+        self.rng = rng
+        # area the predator flies over, the surface unless it hunts a flock with its own world
+        self.width, self.height = world_size if world_size is not None else surface.get_size()
+        self.wrap = wrap
         self.rot_deg = 0
 
-        self.pos = [randint(0, surface.get_width()), randint(0, surface.get_height())]  # x, y
+        self.pos = [rng.randint(0, self.width), rng.randint(0, self.height)]  # x, y
         self.vel = [0, 0]  # x, y
         self.min_speed = 1
         self.max_speed = 7  # 3 or 5
@@ -264,65 +737,77 @@ class BoidPredator:
 
         self.min_attack_timer = int(minute * 0.1)
         self.max_attack_timer = int(minute * 0.7)
-        self.attack_timer = randint(self.min_attack_timer, self.max_attack_timer)
+        self.attack_timer = rng.randint(self.min_attack_timer, self.max_attack_timer)
         self.attack_duration = 60 * 5  # 60fps * 5 seconds
 
         self.centering_factor = 0.01  # how fast moves towards flock center (multiplier)
-        self.circling_pos = [randint(0, self.surface.get_width()), randint(0, self.surface.get_height())]
+        self.circling_pos = [rng.randint(0, self.width), rng.randint(0, self.height)]
         self.circling_factor = 0.004
         self.circling_max_speed = 4
 
     def get_pos(self):
         return self.pos
 
-    def update(self, boids, wind):
-        # alignment and cohesion
-        avg_x_pos = 0
-        avg_y_pos = 0
-        neighbours = 0
-
-        self.attack_timer -= 1
-
-        # loop through all other boids in flock
-        for b in boids:
-            bpos = b.get_pos()
-            dist = get_distance(self.pos, bpos)
-            # attack if timer is in attack window
-            if -self.attack_duration <= self.attack_timer < 0:
-                avg_x_pos += bpos[0]
-                avg_y_pos += bpos[1]
-                neighbours += 1
+    # returns the [x, y] offset from the predator to a point, the short way round a wrapped world
+    def get_offset(self, point):
+        dx = point[0] - self.pos[0]
+        dy = point[1] - self.pos[1]
+        if self.wrap:
+            dx -= self.width * round(dx / self.width)
+            dy -= self.height * round(dy / self.height)
+        return dx, dy
+
+    # flock_stats is the hunted flock's FlockStats. target is the [x, y] to attack, None for the flock's centroid.
+    # jitter is the [x, y] random(0.5, 1) circling multipliers, drawn here if None (Flock draws every predator's at
+    # once).
+    # tick_scale is how many 60ths of a second a tick is (speeds, steering and timers are tuned for 60 ticks a second)
+    def update(self, flock_stats, wind, target=None, jitter=None, tick_scale=1):
+        self.attack_timer -= tick_scale
+        start_x_vel, start_y_vel = self.vel
+
+        # attack if timer is in attack window, tending towards the target (or centre of the entire flock)
+        attacking = -self.attack_duration <= self.attack_timer < 0 and flock_stats.count > 0
 
         # if attack timer is exceeded, reset all
         if self.attack_timer < -self.attack_duration:
-            self.attack_timer = randint(self.min_attack_timer, self.max_attack_timer)
-            self.circling_pos = [randint(0, self.surface.get_width()), randint(0, self.surface.get_height())]
-
-        # tend towards avg pos of entire flock when attacking (neighbours only incremented when attacking)
-        if neighbours > 0:
-            avg_x_pos /= neighbours
-            avg_y_pos /= neighbours
-            self.vel[0] += (avg_x_pos - self.pos[0]) * self.centering_factor
-            self.vel[1] += (avg_y_pos - self.pos[1]) * self.centering_factor
+            self.attack_timer = self.rng.randint(self.min_attack_timer, self.max_attack_timer)
+            self.circling_pos = [self.rng.randint(0, self.width), self.rng.randint(0, self.height)]
+
+        # tend towards target (avg pos of entire flock by default) when attacking
+        if attacking:
+            if target is None:
+                target = flock_stats.centroid
+            dx, dy = self.get_offset(target)
+            self.vel[0] += dx * self.centering_factor
+            self.vel[1] += dy * self.centering_factor
         # otherwise circle around point
         elif self.attack_timer >= 0:
             # multiply by random(0.5, 1) to add randomness to circling path
-            self.vel[0] += (self.circling_pos[0] - self.pos[0]) * self.circling_factor * randint(5, 10) / 10
-            self.vel[1] += (self.circling_pos[1] - self.pos[1]) * self.circling_factor * randint(5, 10) / 10
-
-        # - steer away from screen edges -
-        # left margin
-        if self.pos[0] < self.screen_margin:
-            self.vel[0] += self.turn_factor
-        # right margin
-        elif self.pos[0] > self.surface.get_width() - self.screen_margin:
-            self.vel[0] -= self.turn_factor
-        # bottom margin
-        if self.pos[1] > self.surface.get_height() - self.screen_margin:
-            self.vel[1] -= self.turn_factor
-        # top margin
-        elif self.pos[1] < self.screen_margin:
-            self.vel[1] += self.turn_factor
+            if jitter is None:
+                jitter = [self.rng.randint(5, 10) / 10, self.rng.randint(5, 10) / 10]
+            dx, dy = self.get_offset(self.circling_pos)
+            self.vel[0] += dx * self.circling_factor * jitter[0]
+            self.vel[1] += dy * self.circling_factor * jitter[1]
+
+        # - steer away from screen edges (wrapped worlds have none) -
+        if not self.wrap:
+            # left margin
+            if self.pos[0] < self.screen_margin:
+                self.vel[0] += self.turn_factor
+            # right margin
+            elif self.pos[0] > self.width - self.screen_margin:
+                self.vel[0] -= self.turn_factor
+            # bottom margin
+            if self.pos[1] > self.height - self.screen_margin:
+                self.vel[1] -= self.turn_factor
+            # top margin
+            elif self.pos[1] < self.screen_margin:
+                self.vel[1] += self.turn_factor
+
+        # steering is tuned per 60th of a second, scale it to the length of a tick
+        if tick_scale != 1:
+            self.vel[0] = start_x_vel + (self.vel[0] - start_x_vel) * tick_scale
+            self.vel[1] = start_y_vel + (self.vel[1] - start_y_vel) * tick_scale
 
         # - set speed within bounds -
         speed = math.sqrt(self.vel[0] ** 2 + self.vel[1] ** 2)
@@ -340,8 +825,15 @@ class BoidPredator:
 
         # - apply velocity and wind -
         # wind is separate force to boid velocity (external force)
-        self.pos[0] += self.vel[0] + wind[0]
-        self.pos[1] += self.vel[1] + wind[1]
+        if tick_scale == 1:
+            self.pos[0] += self.vel[0] + wind[0]
+            self.pos[1] += self.vel[1] + wind[1]
+        else:
+            self.pos[0] += (self.vel[0] + wind[0]) * tick_scale
+            self.pos[1] += (self.vel[1] + wind[1]) * tick_scale
+        if self.wrap:
+            self.pos[0] %= self.width
+            self.pos[1] %= self.height
 
         # - calculate angle (for rendering) -
         self.rot_deg = math.degrees(math.atan2(self.vel[0], self.vel[1]))
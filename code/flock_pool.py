@@ -0,0 +1,132 @@
+import atexit, multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from profiler import profiler
+
+# state owned by each worker process (set up once by init_worker)
+worker = {}
+
+
+# lays out every shared array of a flock of a given size in a single buffer, returns {name: ndarray view}
+def get_views(buffer, size):
+    layout = [('pos0', (size, 2), np.float64), ('vel0', (size, 2), np.float64),
+              ('pos1', (size, 2), np.float64), ('vel1', (size, 2), np.float64),
+              ('wind', (size, 2), np.float64), ('heading', (size,), np.float64), ('cx', (size,), np.intp),
+              ('cy', (size,), np.intp)]
+    views = {}
+    offset = 0
+    for name, shape, dtype in layout:
+        views[name] = np.ndarray(shape, dtype, buffer, offset)
+        offset += views[name].nbytes
+    return views
+
+
+def get_buffer_size(size):
+    return size * (8 * 2 * 5 + 8 + np.dtype(np.intp).itemsize * 2)
+
+
+def init_worker(shm_name, boids):
+    worker['shm'] = shared_memory.SharedMemory(name=shm_name)
+    worker['views'] = get_views(worker['shm'].buf, len(boids))
+    worker['boids'] = boids  # private copy of the BoidArrays (rule constants and chunk grid)
+
+
+# steps every boid in chunk rows [row_start, row_end) using the front buffers and writes them to the back buffers.
+# Boids in the halo rows either side are binned as neighbours but not stepped. predator_pos is a tuple of (x, y).
+# wind is the (x, y) of the whole flock, None to read every boid's own from the shared wind array
+def update_stripe(row_start, row_end, front, wind, predator_pos):
+    views = worker['views']
+    boids = worker['boids']
+    back = 1 - front
+    boids.pos = views[f'pos{front}']
+    boids.vel = views[f'vel{front}']
+    cx = views['cx']
+    cy = views['cy']
+
+    # bin the stripe and its halo. members stay in flock order, so each chunk lists its boids in the same order as
+    # the full flock's chunks and the sums accumulate identically to a serial update
+    members = np.flatnonzero((cy >= row_start - 1) & (cy <= row_end))
+    boids.chunks.insert_coords(cx[members], cy[members])
+    stepped = (cy[members] >= row_start) & (cy[members] < row_end)
+    pairs_i, pairs_j = boids.chunks.get_block_pairs(cx[members][stepped], cy[members][stepped])
+
+    stripe = members[stepped]
+    if wind is None:
+        wind = views['wind'][stripe]
+    predator_pos = np.array(predator_pos, dtype=float).reshape(-1, 2)
+    pos, vel, heading = boids.steer(stripe, pairs_i, members[pairs_j], wind, predator_pos)
+    views[f'pos{back}'][stripe] = pos
+    views[f'vel{back}'][stripe] = vel
+    views['heading'][stripe] = heading
+
+
+# updates a numpy backend flock on a pool of worker processes. The chunk grid is split into horizontal stripes of
+# rows, each worker steps the boids of a stripe, reading neighbours (including a halo row each side) from the front
+# buffers in shared memory and writing to the back buffers, which become the front buffers for the next frame.
+# Every boid only reads last frame's state, so the result is identical to the serial update for any worker count
+class FlockPool:
+    def __init__(self, boids, workers, stripes=None):
+        self.boids = boids
+        self.workers = workers
+        # several stripes per worker balances load when the flock is bunched up in a few rows
+        rows = boids.chunks.cells_height
+        stripes = min(stripes or workers * 4, rows)
+        bounds = np.linspace(0, rows, stripes + 1).astype(int)
+        self.stripes = [(int(bounds[s]), int(bounds[s + 1])) for s in range(stripes)]
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(get_buffer_size(len(boids)), 1))
+        self.views = get_views(self.shm.buf, len(boids))
+        self.front = 0
+        self.views['pos0'][:] = boids.pos
+        self.views['vel0'][:] = boids.vel
+        self.views['heading'][:] = boids.heading
+        self.bind()
+
+        # fork keeps workers from re-running the entry point (main.py sets up a window at import)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self.pool = context.Pool(workers, init_worker, (self.shm.name, boids))
+        # shared memory outlives the process unless unlinked, so exits that skip close() still clean up
+        atexit.register(self.close)
+
+    # points the flock at the current front buffers
+    def bind(self):
+        self.boids.pos = self.views[f'pos{self.front}']
+        self.boids.vel = self.views[f'vel{self.front}']
+        self.boids.heading = self.views['heading']
+
+    # wind is the flock's (x, y) or every boid's (n, 2) wind
+    def update(self, wind, predators=()):
+        if len(self.boids) == 0:
+            return
+        # clamping and chunk lookup is cheap, so it is done once here rather than by every worker
+        with profiler.scope('flock.binning'):
+            self.views['cx'][:], self.views['cy'][:] = self.boids.get_chunks()
+
+        predator_pos = tuple(tuple(p.get_pos()) for p in predators)
+        if np.ndim(wind) == 2:
+            # per boid wind goes through shared memory rather than being pickled to every worker
+            self.views['wind'][:] = wind
+            wind = None
+        else:
+            wind = tuple(wind)
+        with profiler.scope('flock.workers'):
+            self.pool.starmap(update_stripe, [(start, end, self.front, wind, predator_pos)
+                                              for start, end in self.stripes])
+        self.front = 1 - self.front
+        self.bind()
+
+    def close(self):
+        if self.views is None:
+            return
+        atexit.unregister(self.close)
+        # close rather than terminate, pygame's SIGTERM handler in the forked workers would ignore terminate
+        self.pool.close()
+        self.pool.join()
+        # the flock keeps its own copy of the state so it stays usable after the shared memory is gone
+        self.boids.pos = self.boids.pos.copy()
+        self.boids.vel = self.boids.vel.copy()
+        self.boids.heading = self.boids.heading.copy()
+        self.views = None
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+# aggregate state of a flock (boid count, centroid, mean velocity and bounding box). Flock refreshes it once per tick
+# as part of its update (object flocks while binning their boids), so anything steering by the whole flock (e.g.
+# predators) reads it rather than scanning every boid itself
+class FlockStats:
+    def __init__(self):
+        self.count = 0
+        self.centroid = [0, 0]  # x, y
+        self.mean_vel = [0, 0]  # x, y
+        self.bbox = None  # x1, y1, x2, y2 (None while the flock is empty)
+
+    # sets the stats from the boid count, position sum (x, y), velocity sum (x, y) and bounding box (x1, y1, x2, y2)
+    def set(self, count, pos_sum, vel_sum, bbox):
+        self.count = count
+        if count > 0:
+            self.centroid = [pos_sum[0] / count, pos_sum[1] / count]
+            self.mean_vel = [vel_sum[0] / count, vel_sum[1] / count]
+            self.bbox = tuple(bbox)
+        else:
+            self.centroid = [0, 0]
+            self.mean_vel = [0, 0]
+            self.bbox = None
+
+    # from (n, 2) position and velocity arrays. wrap_size (width, height) is the size of a toroidal world, where the
+    # centroid is the circular mean of the positions (a plain mean of boids either side of an edge lands mid world)
+    def set_arrays(self, pos, vel, wrap_size=None):
+        if len(pos) == 0:
+            self.set(0, None, None, None)
+            return
+        pos_min = pos.min(axis=0).tolist()
+        pos_max = pos.max(axis=0).tolist()
+        self.set(len(pos), pos.sum(axis=0).tolist(), vel.sum(axis=0).tolist(), pos_min + pos_max)
+        if wrap_size is not None:
+            size = np.array(wrap_size, dtype=float)
+            angle = pos * (2 * np.pi / size)
+            mean = np.arctan2(np.sin(angle).mean(axis=0), np.cos(angle).mean(axis=0))
+            centroid = mean * (size / (2 * np.pi)) % size
+            centroid[centroid >= size] = 0  # tiny negative means round up to the far edge
+            self.centroid = centroid.tolist()
@@ -6,8 +6,19 @@ screen_width = 80 * tile_size  # arbitrary
 screen_height = 50 * tile_size  # arbitrary
 # MUST BE INT
 scaling_factor = 1  # how much the screen is scaled up before blitting on display
+integer_scaling = False  # scale the screen by whole numbers only, centred in the window with borders
 
 game_speed = 60  # fps
+# flock updates per second, independent of the frame rate. The flock is tuned for 60, other rates scale every
+# update to cover 60 / tick_rate of its ticks (e.g. 120 on fast machines for finer steps of the same motion)
+tick_rate = 60
+max_ticks_per_frame = 5  # ticks a slow frame can catch up on, past that the simulation slows down instead
+seed = None  # int for reproducible runs (same flock layout, wind, predators...), None for different every run
+replay_path = None  # trajectory file (recorded with F6) to play back instead of simulating flocks
+
+# only clear, redraw and update the parts of the screen that changed since last frame (faster for sparse scenes)
+dirty_rendering = False
+max_dirty_rects = 1000  # above this many rects a frame falls back to a full redraw
 
 controller_map = {'square': 0, 'X': 1, 'circle': 2, 'triangle': 3, 'L1': 4, 'R1': 5, 'L2': 6, 'R2': 7, 'share': 8,
                   'options': 9, 'left_analog_press': 10, 'right_analog_press': 11, 'PS': 12, 'touchpad': 13,
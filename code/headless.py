@@ -0,0 +1,124 @@
+# headless flock simulation, steps flocks as fast as possible with no window, drawing or frame cap and reports raw
+# simulation throughput. e.g. from the code folder:
+#   python headless.py --size 5000 --backend numpy --frames 600
+
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # no display needed (must be set before pygame is imported)
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # keep stdout clean for --json
+
+import argparse, json, time
+import pygame
+import pytmx
+from game_data import screen_width, screen_height, tick_rate
+from boids import Flock
+from rng import RandomStreams
+from obstacles import DistanceField
+from snapshot import save_flock, load_flock
+
+
+# builds flocks against an off-screen surface. Each update is one fixed tick of 1 / tick_rate seconds of sim time
+def create_flocks(width, height, flock_size, flocks=1, use_predator=False, use_wind=False, backend='objects',
+                  workers=0, synchronous=False, lod_interval=1, world_size=None, wrap=False, predators=1,
+                  predator_targeting='flock', seed=None, wind_field=False, map_path=None, cluster_range=0,
+                  tick_rate=tick_rate):
+    surface = pygame.Surface((width, height))  # never displayed, only gives the flock its size
+    rng = RandomStreams(seed)
+    obstacles = DistanceField.from_tmx(pytmx.TiledMap(map_path)) if map_path is not None else None
+    return [Flock(surface, flock_size, use_predator, use_wind, backend, workers, synchronous,
+                  lod_interval=lod_interval, world_size=world_size, wrap=wrap, predators=predators,
+                  predator_targeting=predator_targeting, rng=rng, wind_field=wind_field, obstacles=obstacles,
+                  cluster_range=cluster_range, tick_rate=tick_rate)
+            for i in range(flocks)]
+
+
+# steps every flock frames times (in batches of batch ticks between clock reads) and returns throughput stats
+def run(flocks, frames, warmup=0, batch=1, tick_rate=tick_rate):
+    for i in range(warmup):
+        for f in flocks:
+            f.update()
+
+    agents = sum(len(f.boids) for f in flocks)
+    steps = 0
+    start = time.perf_counter()
+    while steps < frames:
+        for i in range(min(batch, frames - steps)):
+            for f in flocks:
+                f.update()
+        steps += min(batch, frames - steps)
+    elapsed = time.perf_counter() - start
+
+    return {'frames': steps,
+            'agents': agents,
+            'seconds': elapsed,
+            'sim_seconds': steps / tick_rate,
+            'steps_per_sec': steps / elapsed if elapsed > 0 else float('inf'),
+            'agent_steps_per_sec': steps * agents / elapsed if elapsed > 0 else float('inf')}
+
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run boid flocks without a display and report throughput.')
+    parser.add_argument('--width', type=int, default=screen_width)
+    parser.add_argument('--height', type=int, default=screen_height)
+    parser.add_argument('--size', type=int, default=50, help='boids per flock')
+    parser.add_argument('--flocks', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=600, help='ticks to time')
+    parser.add_argument('--warmup', type=int, default=60, help='untimed ticks before timing')
+    parser.add_argument('--batch', type=int, default=1, help='ticks stepped between clock reads')
+    parser.add_argument('--backend', choices=['objects', 'numpy'], default='objects')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--synchronous', action='store_true')
+    parser.add_argument('--lod', type=int, default=1, help='ticks between updates of boids outside the view')
+    parser.add_argument('--world', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help='flock world size, bigger than the screen (numpy backend)')
+    parser.add_argument('--wrap', action='store_true', help='toroidal world with no edges (numpy backend)')
+    parser.add_argument('--predator', action='store_true')
+    parser.add_argument('--predators', type=int, default=1, help='predators per flock (with --predator)')
+    parser.add_argument('--targeting', choices=['flock', 'local'], default='flock',
+                        help='predators attack the centre of the whole flock or of the boids around them')
+    parser.add_argument('--wind', action='store_true')
+    parser.add_argument('--wind-field', action='store_true', help='wind that varies over the world')
+    parser.add_argument('--map', metavar='PATH', help='tiled map (.tmx) whose collideable tiles the boids avoid')
+    parser.add_argument('--clusters', type=int, default=0, metavar='RINGS',
+                        help='rings of chunks felt through chunk summaries, hierarchical flocks (numpy backend)')
+    parser.add_argument('--tick-rate', type=int, default=tick_rate, help='updates per second of sim time')
+    parser.add_argument('--seed', type=int, help='seed for a reproducible run')
+    # '{}' in a snapshot or recording path is replaced by the flock number, for runs with several flocks
+    parser.add_argument('--load', metavar='PATH', help='start from a flock snapshot (same size and predators)')
+    parser.add_argument('--save', metavar='PATH', help='save a flock snapshot after the run')
+    parser.add_argument('--record', metavar='PATH', help='record trajectories of the run (warmup included)')
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_args(argv)
+    flocks = create_flocks(args.width, args.height, args.size, args.flocks, args.predator, args.wind, args.backend,
+                           args.workers, args.synchronous, args.lod, args.world, args.wrap, args.predators,
+                           args.targeting, args.seed, args.wind_field, args.map, args.clusters,
+                           args.tick_rate)
+    try:
+        if args.load:
+            for i, f in enumerate(flocks):
+                load_flock(f, args.load.format(i))
+        if args.record:
+            for i, f in enumerate(flocks):
+                f.start_recording(args.record.format(i))
+        results = run(flocks, args.frames, args.warmup, args.batch, args.tick_rate)
+        if args.save:
+            for i, f in enumerate(flocks):
+                save_flock(f, args.save.format(i))
+    finally:
+        for f in flocks:
+            f.close()
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print(f"{results['frames']} frames of {results['agents']} boids in {results['seconds']:.3f}s")
+        print(f"steps/sec: {results['steps_per_sec']:.1f}")
+        print(f"agent-steps/sec: {results['agent_steps_per_sec']:.0f}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
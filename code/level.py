@@ -1,10 +1,15 @@
 # - libraries -
-import pygame
+import pygame, os
+import pytmx
 from pytmx.util_pygame import load_pygame  # allows use of tiled tile map files for pygame use
 # - general -
-from game_data import tile_size, controller_map, fonts
+from game_data import tile_size, controller_map, fonts, tick_rate, max_ticks_per_frame, seed, replay_path
 from support import *
 from boids import Flock
+from rng import RandomStreams
+from snapshot import save_flock, load_flock
+from replay import FlockReplay
+from obstacles import DistanceField
 # - systems -
 from camera import Camera
 from text import Font
@@ -22,6 +27,7 @@ class Level:
         self.screen_height = screen_surface.get_height()
 
         self.controllers = controllers
+        self.rng = RandomStreams(seed)  # every random draw in the level comes from a stream of this
 
         self.starting_spawn = starting_spawn
         self.player_spawn = None  # begins as no spawn as filled when player is initialised
@@ -40,7 +46,43 @@ class Level:
         flocks = 1
         use_predator = True
         use_wind = False
-        self.flocks = [Flock(self.screen_surface, flock_size, use_predator, use_wind) for i in range(flocks)]
+        backend = 'objects'  # 'objects' or 'numpy' (use numpy for flocks in the thousands)
+        workers = 0  # processes per flock for parallel updates (numpy backend only, 0 updates on the main process)
+        synchronous = False  # double buffer object boids so frames don't depend on update order
+        sprites = False  # draw boids from pre-rotated sprites with Surface.blits rather than the pixel rasteriser
+        lod_interval = 1  # ticks between updates of boids outside the view (1 updates every boid every tick)
+        world_size = None  # (width, height) of a world bigger than the screen for the flocks (numpy backend only)
+        wrap = False  # toroidal flock world, boids fly off one edge onto the other (numpy backend only)
+        predators = 1  # predators per flock (if use_predator)
+        predator_targeting = 'flock'  # predators attack the centre of the 'flock' or of the 'local' boids around them
+        wind_field = False  # wind that varies over the world (added to use_wind's flock-wide wind)
+        avoid_obstacles = False  # steer around the map's collideable tiles (the map is not drawn, so off by default)
+        obstacles = None
+        if avoid_obstacles:
+            # only the map's tile data is needed, so it is loaded without its images
+            obstacles = DistanceField.from_tmx(pytmx.TiledMap(resource_path(level_data)))
+        cluster_range = 0  # rings of chunks felt through chunk summaries, for huge flocks (numpy backend only)
+        if replay_path is not None:
+            # plays a recording back in place of the flocks
+            self.replay = FlockReplay(self.screen_surface, replay_path, sprites)
+            self.flocks = [self.replay]
+        else:
+            self.replay = None
+            self.flocks = [Flock(self.screen_surface, flock_size, use_predator, use_wind, backend=backend,
+                                 workers=workers, synchronous=synchronous, sprites=sprites, lod_interval=lod_interval,
+                                 world_size=world_size, wrap=wrap, predators=predators,
+                                 predator_targeting=predator_targeting, rng=self.rng, wind_field=wind_field,
+                                 obstacles=obstacles, cluster_range=cluster_range, tick_rate=tick_rate)
+                           for i in range(flocks)]
+        self.scroll_speed = 10  # pixels per frame the arrow keys scroll the flock world
+        self.replay_keys_pressed = set()  # replay control keys held last frame (acted on once per press)
+
+        # fixed timestep, flocks update tick_rate times a second whatever the frame rate and are drawn interpolated
+        # between their last two ticks
+        self.tick_time = 1 / tick_rate  # seconds
+        self.accumulator = 0  # seconds of real time not yet simulated
+        for f in self.flocks:
+            f.interpolate = True
 
 # -- check methods --
 
@@ -56,6 +98,26 @@ class Level:
         else:
             self.pause_pressed = False
 
+        # scroll flock worlds, the scroll value is the same form Camera.get_scroll gives
+        scroll_value = [(keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * self.scroll_speed,
+                        (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * self.scroll_speed]
+        if scroll_value != [0, 0]:
+            for f in self.flocks:
+                f.scroll(scroll_value)
+
+        # replay controls: [ and ] seek back and forward 10 seconds, home back to the start, - and = halve and
+        # double the playback speed
+        if self.replay is not None:
+            seek = 10 * tick_rate
+            actions = {pygame.K_LEFTBRACKET: lambda: self.replay.seek(self.replay.position - seek),
+                       pygame.K_RIGHTBRACKET: lambda: self.replay.seek(self.replay.position + seek),
+                       pygame.K_HOME: lambda: self.replay.seek(0),
+                       pygame.K_MINUS: lambda: self.replay.change_speed(0.5),
+                       pygame.K_EQUALS: lambda: self.replay.change_speed(2)}
+            pressed = {key for key in actions if keys[key]}
+            for key in pressed - self.replay_keys_pressed:
+                actions[key]()
+            self.replay_keys_pressed = pressed
 
         # TODO testing, remove
         if keys[pygame.K_z] and keys[pygame.K_LSHIFT]:
@@ -63,6 +125,53 @@ class Level:
         elif keys[pygame.K_z]:
             self.dev_debug = True
 
+# -- rendering --
+
+    # returns rects covering everything drawn this frame, or None if the whole screen changed
+    def get_dirty_rects(self):
+        if self.pause or self.dev_debug:
+            return None
+        rects = []
+        for f in self.flocks:
+            flock_rects = f.get_rects()
+            if flock_rects is None:
+                return None
+            rects += flock_rects
+        return rects
+
+# -- saving --
+
+    # saves every flock's simulation state to a snapshot file in the save folder
+    def save_flocks(self):
+        if self.replay is not None:
+            return
+        for i, f in enumerate(self.flocks):
+            save_flock(f, get_save_path(f'flock_{i}.snap'))
+
+    # restores every flock saved with save_flocks (flocks that haven't been saved are left alone)
+    def load_flocks(self):
+        if self.replay is not None:
+            return
+        for i, f in enumerate(self.flocks):
+            path = get_save_path(f'flock_{i}.snap')
+            if os.path.getsize(path) > 0:  # get_save_path creates the file empty if it doesn't exist
+                load_flock(f, path)
+
+    # starts or stops recording every flock's trajectories to files in the save folder
+    def toggle_recording(self):
+        if self.replay is not None:
+            return
+        for i, f in enumerate(self.flocks):
+            if f.recorder is None:
+                f.start_recording(get_save_path(f'flock_{i}.traj'))
+            else:
+                f.stop_recording()
+
+    # closes every flock, finishing recordings and freeing pooled flocks' workers, before the game exits
+    def close(self):
+        for f in self.flocks:
+            f.close()
+
 # -- menus --
 
     def pause_menu(self):
@@ -86,15 +195,25 @@ class Level:
 
         # -- CHECKS (For the previous frame)  --
         if not self.pause:
+            # dt is in 60fps frames
+            self.accumulator += dt / 60
+            ticks = int(self.accumulator // self.tick_time)
+            # drop time that would take too many ticks to catch up on (slow frames would only get slower)
+            if ticks > max_ticks_per_frame:
+                ticks = max_ticks_per_frame
+                self.accumulator = ticks * self.tick_time
+            self.accumulator -= ticks * self.tick_time
 
         # -- UPDATES -- player needs to be before tiles for scroll to function properly
-            for f in self.flocks:
-                f.update()
+            for i in range(ticks):
+                for f in self.flocks:
+                    f.update()
 
         # -- RENDER --
-        # Draw
+        # Draw, how far into the next tick the frame is
+        alpha = min(self.accumulator / self.tick_time, 1)
         for f in self.flocks:
-            f.draw()
+            f.draw(alpha)
 
         # must be after other renders to ensure menu is drawn last
         if self.pause:
@@ -1,11 +1,12 @@
 import pygame
 from math import sin
-from random import randint
+import random
 from support import circle_surf, pos_for_center
 
 
 class Light:
-    def __init__(self, surface, pos, colour, raycasted, max_radius, min_radius=0, glow_speed=0):
+    # rng is the random or random.Random the glow's starting phase is drawn from
+    def __init__(self, surface, pos, colour, raycasted, max_radius, min_radius=0, glow_speed=0, rng=random):
         self.surface = surface
         self.pos = pos
         self.raycasted = raycasted
@@ -15,7 +16,7 @@ class Light:
         self.min_radius = min_radius
         self.radius = max_radius
         self.colour = colour
-        self.time = randint(1, 500)
+        self.time = rng.randint(1, 500)
         self.glow_speed = glow_speed
         self.image = circle_surf(self.radius, self.colour)
 
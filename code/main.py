@@ -7,7 +7,9 @@ import pygame, sys, time
 from level import Level
 from text import Font
 from game_data import *
-from support import resource_path
+from support import resource_path, get_save_path
+from profiler import profiler
+from presenter import Presenter
 
 # General setup
 pygame.mixer.pre_init(44100, -16, 2, 512)
@@ -30,6 +32,7 @@ window = pygame.display.set_mode((int(screen_width * scaling_factor), int(screen
 # all pixel values in game logic should be based on the screen! NO .display FUNCTIONS!!
 screen = pygame.Surface((screen_width, screen_height))  # the display surface, re-scaled and blit to the window
 screen_rect = screen.get_rect()  # used for camera scroll boundaries
+presenter = Presenter(screen, window, integer_scaling)  # copies the screen to the window every frame
 
 # caption and icon
 pygame.display.set_caption('Boid Sim')
@@ -55,21 +58,24 @@ def game():
     click = False
 
     # delta time
-    previous_time = time.time()
-    dt = time.time() - previous_time
-    previous_time = time.time()
+    previous_time = time.perf_counter()
+    dt = time.perf_counter() - previous_time
+    previous_time = time.perf_counter()
     fps = clock.get_fps()
 
     # MODIFY TO LOAD DESIRED ROOMS
     starting_spawn = 'room_1'
     level = Level('../rooms/tiled_rooms/room_0.tmx', screen, screen_rect, joysticks, starting_spawn)
 
+    # dirty rect rendering, rects drawn last frame (None redraws the whole screen)
+    previous_rects = None
+
     run = True
     while run:
         # delta time  https://www.youtube.com/watch?v=OmkAUzvwsDk
-        dt = time.time() - previous_time
+        dt = time.perf_counter() - previous_time
         dt *= 60  # keeps units such that movement += 1 * dt means add 1px if at 60fps
-        previous_time = time.time()
+        previous_time = time.perf_counter()
         fps = clock.get_fps()
 
         # x and y mouse pos
@@ -77,49 +83,96 @@ def game():
 
         # -- INPUT --
         click = False
-        for event in pygame.event.get():
-
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+        with profiler.scope('input'):
+            for event in pygame.event.get():
 
-            # Keyboard events
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_COMMA or event.key == pygame.K_ESCAPE:
-                    run = False
-                    pygame.quit()
-                    sys.exit()
-                # TODO Debugging only, remove
-                elif event.key == pygame.K_x:
-                    global game_speed
-                    if game_speed == 60:
-                        game_speed = 20
-                    else:
-                        game_speed = 60
-
-            # Mouse events
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    click = True
-
-            # Controller events
-            elif event.type == pygame.JOYBUTTONDOWN:
-                if event.button == controller_map['left_analog_press']:
-                    run = False
+                if event.type == pygame.QUIT:
+                    level.close()
                     pygame.quit()
                     sys.exit()
 
-        # -- Update --
-        screen.fill((48, 99, 142))  # fill background with colour
-        level.update(dt)  # runs level processes
-
-        font.render(f'FPS: {str(clock.get_fps())}', screen, (0, 0))  # TODO Debugging only, remove
+                # Keyboard events
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_COMMA or event.key == pygame.K_ESCAPE:
+                        run = False
+                        level.close()
+                        pygame.quit()
+                        sys.exit()
+                    # TODO Debugging only, remove
+                    elif event.key == pygame.K_x:
+                        global game_speed
+                        if game_speed == 60:
+                            game_speed = 20
+                        else:
+                            game_speed = 60
+                    # profiler overlay on/off and export of the recorded frames
+                    elif event.key == pygame.K_F3:
+                        profiler.toggle()
+                    elif event.key == pygame.K_F4:
+                        profiler.export_csv(get_save_path('profile.csv'))
+                        profiler.export_json(get_save_path('profile.json'))
+                    # flock snapshots, save and restore the simulation
+                    elif event.key == pygame.K_F5:
+                        level.save_flocks()
+                    elif event.key == pygame.K_F9:
+                        level.load_flocks()
+                    # trajectory recording on/off
+                    elif event.key == pygame.K_F6:
+                        level.toggle_recording()
+
+                # Mouse events
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.button == 1:
+                        click = True
+
+                # Controller events
+                elif event.type == pygame.JOYBUTTONDOWN:
+                    if event.button == controller_map['left_analog_press']:
+                        run = False
+                        level.close()
+                        pygame.quit()
+                        sys.exit()
 
-        window.blit(pygame.transform.scale(screen, window.get_rect().size), (0, 0))  # scale screen to window
+        # -- Update --
+        with profiler.scope('fill'):
+            if previous_rects is None:
+                screen.fill((48, 99, 142))  # fill background with colour
+            else:
+                # only clear what was drawn last frame
+                for rect in previous_rects:
+                    screen.fill((48, 99, 142), rect)
+        with profiler.scope('level'):
+            level.update(dt)  # runs level processes
+
+        with profiler.scope('text'):
+            fps_text = f'FPS: {str(clock.get_fps())}'
+            font.render(fps_text, screen, (0, 0))  # TODO Debugging only, remove
+            profiler.draw(screen, font, (0, font.line_height + font.line_spacing))
+
+        # rects drawn this frame, None if the whole screen needs presenting
+        rects = level.get_dirty_rects() if dirty_rendering and not profiler.enabled else None
+        if rects is not None:
+            rects.append(pygame.Rect(0, 0, font.width(fps_text) + 1, font.line_height))
+            if len(rects) > max_dirty_rects:
+                rects = None
+        # last frame's rects are presented too so what was cleared reaches the window
+        update_rects = None
+        if rects is not None and previous_rects is not None and len(rects) + len(previous_rects) <= max_dirty_rects:
+            update_rects = previous_rects + rects
+
+        with profiler.scope('present'):
+            window_rects = presenter.present(update_rects)
 
         # -- Render --
-        pygame.display.update()
-        clock.tick(game_speed)
+        with profiler.scope('display.update'):
+            if window_rects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(window_rects)
+        previous_rects = rects
+        with profiler.scope('tick'):
+            clock.tick(game_speed)
+        profiler.end_frame()
 
 
 main_menu()
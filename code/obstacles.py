@@ -0,0 +1,80 @@
+import math
+import numpy as np
+from wind import sample_grid
+
+
+# rows or columns per batch of the distance transform, bounds its (batch, cells, cells) temporaries for big maps
+transform_batch_size = 32
+
+
+# returns the squared distance (rows, columns) from every cell to the nearest cell where target (rows, columns bool)
+# is set, in cells (inf if target is empty). Exact euclidean distance transform done as two separable passes: the
+# nearest target in each column, then the nearest of those along each row
+def get_distance_sq(target):
+    rows, columns = target.shape
+    y = np.arange(rows, dtype=float)
+    x = np.arange(columns, dtype=float)
+    row_offset_sq = (y[:, None] - y[None, :]) ** 2
+    column_offset_sq = (x[:, None] - x[None, :]) ** 2
+
+    column_sq = np.empty((rows, columns))
+    for s in range(0, columns, transform_batch_size):
+        block = target[:, s:s + transform_batch_size].T  # (batch, rows)
+        column_sq[:, s:s + transform_batch_size] = np.where(block[:, None, :], row_offset_sq, np.inf).min(axis=2).T
+    distance_sq = np.empty((rows, columns))
+    for s in range(0, rows, transform_batch_size):
+        block = column_sq[s:s + transform_batch_size]  # (batch, columns)
+        distance_sq[s:s + transform_batch_size] = (block[:, None, :] + column_offset_sq).min(axis=2)
+    return distance_sq
+
+
+# signed distance field of a level's solid tiles, for boids to steer around. Distances (pixels, negative inside
+# solid tiles) and their gradients (unit directions away from the nearest solid) are worked out once for a grid of
+# samples (resolution per tile), so reading them anywhere is one bilinear lookup
+class DistanceField:
+    # solid (rows, columns bool) marks solid tiles
+    def __init__(self, solid, tile_size, resolution=2):
+        self.spacing = tile_size / resolution  # pixels between samples
+        solid = np.repeat(np.repeat(np.asarray(solid, dtype=bool), resolution, axis=0), resolution, axis=1)
+        self.size = (solid.shape[1] * self.spacing, solid.shape[0] * self.spacing)  # width, height
+
+        # distance from sample centres to the nearest sample of the other kind, minus half a sample so the surface
+        # falls between the two
+        outside = np.sqrt(get_distance_sq(solid)) - 0.5
+        inside = np.sqrt(get_distance_sq(~solid)) - 0.5
+        distance = np.where(solid, -inside, outside) * self.spacing
+        distance[np.isinf(distance)] = np.sign(distance[np.isinf(distance)]) * math.hypot(*self.size)
+
+        grad_y, grad_x = np.gradient(distance)
+        length = np.sqrt(grad_x ** 2 + grad_y ** 2)
+        length[length == 0] = 1
+        # distance, x and y gradient per sample
+        self.grid = np.dstack((distance, grad_x / length, grad_y / length))
+        self.grid_lists = self.grid.tolist()  # for sample_one, plain floats index much faster than numpy scalars
+
+    # builds the field from a tile layer (solid where there is a tile) of a pytmx map
+    @classmethod
+    def from_tmx(cls, tmx_data, layer_name='collideable', resolution=2):
+        solid = np.array(tmx_data.get_layer_by_name(layer_name).data) > 0
+        return cls(solid, tmx_data.tilewidth, resolution)
+
+    # returns distance (n,) and gradient (n, 2) at positions pos (n, 2). Positions off the map read its edge
+    def sample(self, pos):
+        samples = sample_grid(self.grid, pos[:, 0] / self.spacing - 0.5, pos[:, 1] / self.spacing - 0.5)
+        return samples[:, 0], samples[:, 1:]
+
+    # sample for a single position (x, y), returns [distance, gradient x, gradient y]. Same bilinear lookup in plain
+    # python, for object boids
+    def sample_one(self, x, y):
+        rows, columns = self.grid.shape[:2]
+        gx = min(max(x / self.spacing - 0.5, 0), columns - 1)
+        gy = min(max(y / self.spacing - 0.5, 0), rows - 1)
+        x0 = min(int(gx), columns - 2)
+        y0 = min(int(gy), rows - 2)
+        fx = gx - x0
+        fy = gy - y0
+        row0 = self.grid_lists[y0]
+        row1 = self.grid_lists[y0 + 1]
+        top = [a + (b - a) * fx for a, b in zip(row0[x0], row0[x0 + 1])]
+        bottom = [a + (b - a) * fx for a, b in zip(row1[x0], row1[x0 + 1])]
+        return [t + (b - t) * fy for t, b in zip(top, bottom)]
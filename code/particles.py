@@ -3,7 +3,8 @@ from support import circle_surf
 
 
 class Particle(pygame.sprite.Sprite):
-    def __init__(self, screen, colour, apply_gravity=False):
+    # rng is the random or random.Random the particle's spawn is drawn from (e.g. a RandomStreams stream)
+    def __init__(self, screen, colour, apply_gravity=False, rng=random):
         super().__init__()
         self.screen = screen
 
@@ -12,14 +13,14 @@ class Particle(pygame.sprite.Sprite):
         self.gravity_vel = 4
 
         # position, velocity, direction, timer
-        self.x = random.randint(0, screen.get_width())
-        self.y = random.randint(0, screen.get_height())
-        self.vel = [random.randint(0, 18) / 10 - 1, random.randint(0, 18) / 10 - 1]
+        self.x = rng.randint(0, screen.get_width())
+        self.y = rng.randint(0, screen.get_height())
+        self.vel = [rng.randint(0, 18) / 10 - 1, rng.randint(0, 18) / 10 - 1]
         self.direction = pygame.math.Vector2()
-        self.timer = random.randint(1, 10)
-        self.size = random.randint(1, 3)
+        self.timer = rng.randint(1, 10)
+        self.size = rng.randint(1, 3)
         while self.size > self.timer:
-            self.timer = random.randint(1, 10)
+            self.timer = rng.randint(1, 10)
 
         # colour
         self.colour = colour
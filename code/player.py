@@ -17,8 +17,9 @@ class Player(pygame.sprite.Sprite):
         self.image.fill((255, 88, 98))
         self.rect = pygame.Rect(spawn.x, spawn.y, self.image.get_width(), self.image.get_height())
         self.light_distance = 40
-        self.lights = [Light(self.surface, self.rect.center, (10, 10, 10), False, 40, 30, 0.02),
-                       Light(self.surface, self.rect.center, (20, 20, 20), False, 25, 20, 0.02)]
+        light_rng = room.rng.get('lights')
+        self.lights = [Light(self.surface, self.rect.center, (10, 10, 10), False, 40, 30, 0.02, light_rng),
+                       Light(self.surface, self.rect.center, (20, 20, 20), False, 25, 20, 0.02, light_rng)]
         # - hitboxes -
         self.norm_hitbox = pygame.Rect(self.rect.midbottom[0], self.rect.midbottom[1], tile_size * 0.8, tile_size * 1.4)  # used for collisions
         self.crouch_hitbox = pygame.Rect(self.rect.midbottom[0], self.rect.midbottom[1], tile_size * 0.8, tile_size * 0.8)  # used for crouched collisions
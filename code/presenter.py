@@ -0,0 +1,86 @@
+import pygame
+
+
+# copies the screen surface (game pixels) to the window without allocating a new surface every frame.
+# If the sizes match the screen is blit straight across, otherwise transform.scale (nearest neighbour) writes
+# straight into the window, or into a subsurface of it that is kept between frames. Only rects that changed can be
+# presented (dirty rect rendering) when the scale is a whole number.
+# integer_scaling scales by the largest whole number that fits and centres the screen in the window (letterboxed)
+# so every game pixel is the same size
+class Presenter:
+    def __init__(self, screen, window, integer_scaling=False):
+        self.screen = screen
+        self.screen_rect = screen.get_rect()
+        self.window = window
+        self.integer_scaling = integer_scaling
+
+        self.window_size = None  # window size the layout below was worked out for
+        self.target_rect = None  # area of the window the screen is drawn to
+        self.target = None  # the window or a subsurface of it covering target_rect
+        self.scale_x = 1
+        self.scale_y = 1
+        self.direct = True  # screen and target are the same size
+        # whole number scale, so a scaled rect lands on exactly the pixels scaling the whole screen would give
+        self.exact = True
+
+    # works out where the screen goes in the window, returns True if it changed (the whole window needs presenting)
+    def update_layout(self):
+        window_size = self.window.get_size()
+        if window_size == self.window_size:
+            return False
+        self.window_size = window_size
+
+        width, height = self.screen_rect.size
+        if self.integer_scaling:
+            factor = max(1, min(window_size[0] // width, window_size[1] // height))
+            self.target_rect = pygame.Rect(0, 0, width * factor, height * factor)
+            self.target_rect.center = self.window.get_rect().center
+            self.target_rect = self.target_rect.clip(self.window.get_rect())
+            self.window.fill((0, 0, 0))  # borders
+        else:
+            self.target_rect = self.window.get_rect()
+
+        if self.target_rect.size == self.window.get_size():
+            self.target = self.window
+        else:
+            self.target = self.window.subsurface(self.target_rect)
+        self.scale_x = self.target_rect.width / width
+        self.scale_y = self.target_rect.height / height
+        self.direct = self.target_rect.size == self.screen_rect.size
+        self.exact = self.scale_x.is_integer() and self.scale_y.is_integer()
+        return True
+
+    # returns the window area a screen rect is drawn to
+    def get_window_rect(self, rect):
+        left = int(rect.x * self.scale_x)
+        top = int(rect.y * self.scale_y)
+        return pygame.Rect(self.target_rect.x + left, self.target_rect.y + top,
+                           int(rect.right * self.scale_x) - left, int(rect.bottom * self.scale_y) - top)
+
+    # copies the screen to the window, only the areas in rects (screen coords) if given.
+    # Returns the window rects to pass to pygame.display.update, None if the whole window changed
+    def present(self, rects=None):
+        # fractional scales sample differently per rect, so they always present everything
+        if self.update_layout() or not self.exact:
+            rects = None
+
+        if rects is None:
+            if self.direct:
+                self.target.blit(self.screen, (0, 0))
+            else:
+                pygame.transform.scale(self.screen, self.target_rect.size, self.target)
+            return None
+
+        window_rects = []
+        for rect in rects:
+            rect = rect.clip(self.screen_rect)
+            if not rect.width or not rect.height:
+                continue
+            window_rect = self.get_window_rect(rect)
+            if self.direct:
+                self.window.blit(self.screen, window_rect, rect)
+            elif window_rect.width and window_rect.height:
+                pygame.transform.scale(self.screen.subsurface(rect), window_rect.size,
+                                       self.window.subsurface(window_rect))
+            window_rects.append(window_rect)
+        return window_rects
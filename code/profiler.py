@@ -0,0 +1,102 @@
+import csv, json, time
+from collections import deque
+
+
+# times one named scope of a frame, used as a context manager:  with profiler.scope('name'): ...
+class Scope:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# does nothing, returned while the profiler is disabled so timed code costs a single call
+class NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+# lightweight per frame phase profiler. Code wraps its phases in named scopes, end_frame() closes the frame and keeps
+# the last history frames of {scope: ms} (scopes hit more than once per frame, e.g. several flocks, are summed)
+class Profiler:
+    def __init__(self, history=300):
+        self.enabled = False
+        self.frames = deque(maxlen=history)
+        self.current = {}
+        self.names = []  # every scope name seen, in first seen order (column order for exports and the overlay)
+        self.frame_start = time.perf_counter()
+        self.null_scope = NullScope()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+    def scope(self, name):
+        if not self.enabled:
+            return self.null_scope
+        return Scope(self, name)
+
+    def add(self, name, seconds):
+        if name not in self.current:
+            self.current[name] = 0
+            if name not in self.names:
+                self.names.append(name)
+        self.current[name] += seconds * 1000
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current['frame'] = (now - self.frame_start) * 1000
+        self.frames.append(self.current)
+        self.current = {}
+        self.frame_start = now
+
+# -- stats --
+
+    # returns {scope: (mean ms, max ms)} over the rolling window
+    def get_stats(self):
+        stats = {}
+        for name in self.names + ['frame']:
+            times = [frame.get(name, 0) for frame in self.frames]
+            if times:
+                stats[name] = (sum(times) / len(times), max(times))
+        return stats
+
+    def draw(self, surface, font, loc):
+        if not self.enabled:
+            return
+        lines = [f'{name}: {mean:.2f}ms  max {peak:.2f}' for name, (mean, peak) in self.get_stats().items()]
+        font.render('\n'.join(lines), surface, loc)
+
+# -- export --
+
+    def export_csv(self, path):
+        columns = self.names + ['frame']
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['index'] + columns)
+            for i, frame in enumerate(self.frames):
+                writer.writerow([i] + [round(frame.get(name, 0), 4) for name in columns])
+
+    def export_json(self, path):
+        with open(path, 'w') as file:
+            json.dump({'stats': {name: {'mean_ms': mean, 'max_ms': peak}
+                                 for name, (mean, peak) in self.get_stats().items()},
+                       'frames': list(self.frames)}, file)
+
+
+# shared profiler for the whole game, toggled from main
+profiler = Profiler()
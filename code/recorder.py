@@ -0,0 +1,185 @@
+import json, queue, threading, zlib
+import numpy as np
+
+# trajectory files: every boid's position and velocity each recorded tick, for offline analysis and replays.
+# File layout: magic, version and header size (16 bytes), a json header (boid count, world size...), then chunks of
+# up to frames_per_chunk frames appended as they are recorded, so a file cut short by a crash still reads up to its
+# last whole chunk. Each chunk is a 16 byte prefix (chunk magic, frame count, boid count, padding), the byte size of
+# every column, then the columns: the ticks, then x, y, vx and vy as (frames, boids) float32.
+# Float columns are delta encoded on their bit patterns (each frame minus the one before as int32, which undoes
+# exactly) and byte shuffled before zlib, so slowly changing values compress to mostly zero bytes
+magic = b'BOIDTRAJ'
+chunk_magic = b'CHNK'
+version = 1
+columns = ('x', 'y', 'vx', 'vy')
+
+
+# returns the compressed bytes of a (frames, boids) float32 column
+def encode_column(column, level):
+    bits = column.view(np.int32)
+    deltas = bits.copy()
+    np.subtract(bits[1:], bits[:-1], out=deltas[1:])
+    shuffled = deltas.view(np.uint8).reshape(-1, 4).T  # all the low bytes, then the next bytes...
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), level)
+
+
+# undoes encode_column, returning the (frames, boids) float32 column
+def decode_column(data, frames, boids):
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(4, -1)
+    deltas = np.ascontiguousarray(shuffled.T).view(np.int32).reshape(frames, boids)
+    return np.cumsum(deltas, axis=0, dtype=np.int32).view(np.float32)
+
+
+# streams a flock's state to a trajectory file. record() copies the state into the chunk being filled and hands full
+# chunks to a writer thread, which encodes and writes them (zlib releases the GIL, so this overlaps the sim).
+# At most max_queued chunks wait for the writer, if it falls further behind chunks are dropped (counted in dropped)
+# rather than stalling the sim. If writing fails (e.g. the disk is full) the writer keeps taking chunks off the queue
+# and discards them, so the sim never blocks on it, and close() raises the error.
+# Call close() to write the last partial chunk and stop the thread
+class TrajectoryRecorder:
+    # wrap marks the flock's world as toroidal (for replays to interpolate across edges)
+    def __init__(self, path, boids, world_size, wrap=False, frames_per_chunk=64, max_queued=8, level=1):
+        self.boids = boids
+        self.frames_per_chunk = frames_per_chunk
+        self.level = level
+        self.dropped = 0  # chunks dropped because the writer fell behind
+        self.error = None  # exception that stopped the writer writing
+
+        self.file = open(path, 'wb')
+        header = json.dumps({'boids': boids, 'world_size': list(world_size), 'wrap': wrap,
+                             'columns': list(columns)}).encode()
+        self.file.write(magic)
+        self.file.write(np.array([version, len(header)], dtype='<u4').tobytes())
+        self.file.write(header)
+
+        self.new_chunk()
+        self.queue = queue.Queue(max_queued)
+        self.thread = threading.Thread(target=self.write_chunks, daemon=True)
+        self.thread.start()
+
+    def new_chunk(self):
+        self.ticks = np.empty(self.frames_per_chunk, dtype=np.int64)
+        self.state = np.empty((len(columns), self.frames_per_chunk, self.boids), dtype=np.float32)
+        self.frames = 0
+
+    # adds a frame, pos and vel are (n, 2) arrays
+    def record(self, tick, pos, vel):
+        self.ticks[self.frames] = tick
+        self.state[0, self.frames] = pos[:, 0]
+        self.state[1, self.frames] = pos[:, 1]
+        self.state[2, self.frames] = vel[:, 0]
+        self.state[3, self.frames] = vel[:, 1]
+        self.frames += 1
+        if self.frames == self.frames_per_chunk:
+            self.flush()
+
+    # hands the chunk being filled to the writer
+    def flush(self):
+        if self.frames == 0:
+            return
+        try:
+            self.queue.put_nowait((self.ticks[:self.frames], self.state[:, :self.frames]))
+        except queue.Full:
+            self.dropped += 1
+        self.new_chunk()
+
+    # writer thread
+    def write_chunks(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.write_chunk(*chunk)
+            except Exception as e:
+                self.error = e
+
+    # encodes and writes a chunk of frames (on the writer thread)
+    def write_chunk(self, ticks, state):
+        frames = len(ticks)
+        data = [zlib.compress(ticks.tobytes(), self.level)]
+        data += [encode_column(column, self.level) for column in state]
+        self.file.write(chunk_magic)
+        self.file.write(np.array([frames, self.boids, 0], dtype='<u4').tobytes())
+        self.file.write(np.array([len(d) for d in data], dtype='<u8').tobytes())
+        for d in data:
+            self.file.write(d)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.queue.put(None)  # the writer drains the queue even after an error, so this can't block for good
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+
+# reads a trajectory file written by TrajectoryRecorder. The file is memory mapped and indexed (one seek per chunk)
+# when opened, chunks are only decompressed when a frame in them is asked for
+class TrajectoryReader:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            if f.read(8) != magic:
+                raise ValueError(f"'{path}' is not a trajectory file")
+            file_version, header_size = np.frombuffer(f.read(8), dtype='<u4').tolist()
+            if file_version != version:
+                raise ValueError(f"trajectory version {file_version} is not supported (expected {version})")
+            header = json.loads(f.read(header_size))
+        self.boids = header['boids']
+        self.world_size = tuple(header['world_size'])
+        self.wrap = header['wrap']
+
+        self.data = np.memmap(path, np.uint8, 'r')
+        # (offset of first column, frames, column sizes) of every whole chunk
+        self.chunks = []
+        self.chunk_starts = []  # frame index each chunk starts at
+        self.frames = 0
+        offset = 16 + header_size
+        prefix_size = 16 + 8 * (len(columns) + 1)
+        while offset + prefix_size <= len(self.data):
+            if self.data[offset:offset + 4].tobytes() != chunk_magic:
+                break
+            frames = int(self.data[offset + 4:offset + 8].view('<u4')[0])
+            sizes = self.data[offset + 16:offset + prefix_size].view('<u8').tolist()
+            if offset + prefix_size + sum(sizes) > len(self.data):
+                break  # cut short while being written
+            self.chunks.append((offset + prefix_size, frames, sizes))
+            self.chunk_starts.append(self.frames)
+            self.frames += frames
+            offset += prefix_size + sum(sizes)
+
+        # chunk index: (ticks, state) of the last two chunks decoded, so frames either side of a chunk boundary
+        # (interpolated replays) don't decode a chunk every frame
+        self.cached = {}
+
+    # returns (ticks (frames,), state (4, frames, boids)) of chunk c
+    def read_chunk(self, c):
+        if c not in self.cached:
+            offset, frames, sizes = self.chunks[c]
+            blobs = []
+            for size in sizes:
+                blobs.append(self.data[offset:offset + size])
+                offset += size
+            ticks = np.frombuffer(zlib.decompress(blobs[0]), dtype=np.int64)
+            state = np.stack([decode_column(blob, frames, self.boids) for blob in blobs[1:]])
+            if len(self.cached) == 2:
+                del self.cached[next(iter(self.cached))]
+            self.cached[c] = ticks, state
+        return self.cached[c]
+
+    # returns (tick, pos (n, 2), vel (n, 2)) of frame i
+    def get_frame(self, i):
+        if not 0 <= i < self.frames:
+            raise IndexError(f'frame {i} out of range ({self.frames} frames)')
+        c = int(np.searchsorted(self.chunk_starts, i, side='right')) - 1
+        ticks, state = self.read_chunk(c)
+        f = i - self.chunk_starts[c]
+        return int(ticks[f]), np.column_stack((state[0, f], state[1, f])), np.column_stack((state[2, f], state[3, f]))
+
+    def close(self):
+        self.data = None
+        self.cached = {}
@@ -0,0 +1,167 @@
+import math
+import pygame
+import numpy as np
+
+# triangles rasterised per batch, keeps the (batch, pixels) temporary arrays small for very large flocks
+raster_batch_size = 8192
+
+# (point_ahead, point_sides, headings): pixel offsets of that triangle at each heading (see get_stencils)
+stencil_cache = {}
+
+
+# returns the (n, 2) unit direction of each velocity in vel (n, 2). Stationary boids point down, like Boid.rot_deg = 0
+def get_directions(vel):
+    speed = np.sqrt((vel ** 2).sum(axis=1))
+    moving = speed > 0
+    direction = np.zeros(vel.shape)
+    direction[:, 1] = 1
+    direction[moving] = vel[moving] / speed[moving, None]
+    return direction
+
+
+# returns the (n, 3, 2) outlines [point ahead, point side1, point side2] of triangles at pos (n, 2) pointing along vel
+# (n, 2). Same shape as Boid.draw, but the direction comes straight from the normalised velocity instead of going
+# through an angle in degrees and sin/cos
+def get_outlines(pos, vel, point_ahead, point_sides):
+    direction = get_directions(vel)
+    # side points are the direction rotated by 90 degrees either way
+    side = np.column_stack((direction[:, 1], -direction[:, 0])) * point_sides
+
+    outlines = np.empty((len(pos), 3, 2))
+    outlines[:, 0] = pos + direction * point_ahead
+    outlines[:, 1] = pos + side
+    outlines[:, 2] = pos - side
+    return outlines
+
+
+# returns the heading bin (0 to headings - 1) of each velocity in vel (n, 2), bin 0 pointing down (Boid.rot_deg = 0)
+def get_heading_bins(vel, headings):
+    angle = np.arctan2(vel[:, 0], vel[:, 1])
+    return np.round(angle * (headings / (2 * math.pi))).astype(np.intp) % headings
+
+
+# pixels from a boid's pixel to the furthest pixel its triangle can cover
+def get_radius(point_ahead, point_sides):
+    return int(math.ceil(max(point_ahead, point_sides))) + 1
+
+
+# returns the outline of a triangle centred on (radius, radius) pointing along heading bin h
+def get_heading_outline(radius, point_ahead, point_sides, h, headings):
+    angle = 2 * math.pi * h / headings
+    direction = np.array([[math.sin(angle), math.cos(angle)]])
+    return get_outlines(np.array([[radius, radius]]), direction, point_ahead, point_sides)[0].tolist()
+
+
+# rasterises the triangle once per heading bin with pygame.draw.polygon (so batched triangles look like Boid.draw)
+# and returns the covered pixels' x and y offsets from the boid's pixel, each (headings, pixels). Headings covering
+# fewer pixels repeat their first pixel so every heading has the same number of pixels
+def get_stencils(point_ahead, point_sides, headings):
+    key = (point_ahead, point_sides, headings)
+    if key not in stencil_cache:
+        radius = get_radius(point_ahead, point_sides)
+        surf = pygame.Surface((radius * 2 + 1, radius * 2 + 1))
+        covered = []
+        for h in range(headings):
+            surf.fill((0, 0, 0))
+            pygame.draw.polygon(surf, (255, 255, 255), get_heading_outline(radius, point_ahead, point_sides, h, headings))
+            x, y = np.nonzero(pygame.surfarray.array2d(surf))
+            covered.append((x - radius, y - radius))
+
+        size = max(len(x) for x, y in covered)
+        offset_x = np.zeros((headings, size), dtype=np.intp)
+        offset_y = np.zeros((headings, size), dtype=np.intp)
+        for h, (x, y) in enumerate(covered):
+            offset_x[h] = x[0]
+            offset_y[h] = y[0]
+            offset_x[h, :len(x)] = x
+            offset_y[h, :len(y)] = y
+        stencil_cache[key] = offset_x, offset_y
+    return stencil_cache[key]
+
+
+# fills a triangle (same shape as Boid.draw) for every boid at pos (n, 2) facing along vel (n, 2).
+# Rather than a pygame.draw.polygon call per boid, each boid's heading picks one of headings pre-rasterised sets of
+# pixel offsets and one vectorised pass writes every boid's pixels straight into the surface's pixel array
+def draw_triangles(surface, pos, vel, point_ahead, point_sides, colour, headings=64):
+    if len(pos) == 0:
+        return
+    # pixel arrays need 8, 16 or 32 bit surfaces, fall back to one draw call per triangle
+    if surface.get_bytesize() not in (1, 2, 4):
+        for outline in get_outlines(pos, vel, point_ahead, point_sides).tolist():
+            pygame.draw.polygon(surface, colour, outline)
+        return
+
+    offset_x, offset_y = get_stencils(point_ahead, point_sides, headings)
+    bins = get_heading_bins(vel, headings)
+    origin = np.round(pos).astype(np.intp)
+    width, height = surface.get_size()
+    mapped = surface.map_rgb(pygame.Color(colour))
+
+    # boids whose triangle can't reach the surface edges skip the bounds checks
+    reach = get_radius(point_ahead, point_sides)
+    interior = ((origin[:, 0] >= reach) & (origin[:, 0] < width - reach) &
+                (origin[:, 1] >= reach) & (origin[:, 1] < height - reach))
+
+    # pixels as a flat array indexed y * row_length + x
+    pixels = pygame.surfarray.pixels2d(surface)
+    row_length = pixels.strides[1] // pixels.strides[0]
+    flat = np.lib.stride_tricks.as_strided(pixels, (row_length * height,), (pixels.strides[0],))
+    offset_flat = offset_y * row_length + offset_x
+
+    boids = np.flatnonzero(interior)
+    for s in range(0, len(boids), raster_batch_size):
+        batch = boids[s:s + raster_batch_size]
+        flat[(origin[batch, 1] * row_length + origin[batch, 0])[:, None] + offset_flat[bins[batch]]] = mapped
+
+    # boids near (or past) the edges only write the pixels that land on the surface
+    boids = np.flatnonzero(~interior)
+    for s in range(0, len(boids), raster_batch_size):
+        batch = boids[s:s + raster_batch_size]
+        px = origin[batch, 0, None] + offset_x[bins[batch]]
+        py = origin[batch, 1, None] + offset_y[bins[batch]]
+        inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        flat[py[inside] * row_length + px[inside]] = mapped
+    del flat, pixels  # unlocks the surface
+
+
+# returns a pygame.Rect for each boid at pos (n, 2) covering every pixel its triangle (draw_triangles, SpriteAtlas)
+# can touch, radius from get_radius
+def get_rects(pos, radius):
+    size = radius * 2 + 1
+    topleft = np.round(pos).astype(int) - radius
+    return [pygame.Rect(x, y, size, size) for x, y in topleft.tolist()]
+
+
+# returns which boids at pos (n, 2) are in view (a pygame.Rect of the world) or within margin pixels of it
+def get_in_view(pos, view, margin):
+    view = view.inflate(margin * 2, margin * 2)
+    return ((pos[:, 0] >= view.left) & (pos[:, 0] < view.right) &
+            (pos[:, 1] >= view.top) & (pos[:, 1] < view.bottom))
+
+
+# triangles (same shape as Boid.draw) pre-rendered at startup as one sprite per heading bin, drawn for a whole flock
+# with a single Surface.blits call. Sprites are created in surface's pixel format so blits don't convert
+class SpriteAtlas:
+    def __init__(self, surface, point_ahead, point_sides, colour, headings=64):
+        self.surface = surface
+        self.headings = headings
+        self.radius = get_radius(point_ahead, point_sides)
+        size = self.radius * 2 + 1
+
+        colour = pygame.Color(colour)
+        key = (255 - colour.r, 255 - colour.g, 255 - colour.b)  # any colour that isn't the triangle's
+        self.sprites = []
+        for h in range(headings):
+            sprite = pygame.Surface((size, size), 0, surface)
+            sprite.fill(key)
+            pygame.draw.polygon(sprite, colour, get_heading_outline(self.radius, point_ahead, point_sides, h, headings))
+            sprite.set_colorkey(key, pygame.RLEACCEL)
+            self.sprites.append(sprite)
+
+    # draws a sprite for every boid at pos (n, 2) facing along vel (n, 2)
+    def draw(self, pos, vel):
+        if len(pos) == 0:
+            return
+        bins = get_heading_bins(np.asarray(vel, dtype=float), self.headings)
+        topleft = np.round(pos).astype(int) - self.radius
+        self.surface.blits(zip(map(self.sprites.__getitem__, bins.tolist()), topleft.tolist()), False)
@@ -0,0 +1,100 @@
+import math
+import pygame
+import numpy as np
+from profiler import profiler
+from recorder import TrajectoryReader
+from render import draw_triangles, get_radius, get_rects, get_in_view, SpriteAtlas
+
+
+# plays back a trajectory file recorded from a Flock (see Flock.start_recording) without simulating anything.
+# Stands in for a Flock in the level: update() moves the playhead on by speed recorded frames per tick and draw()
+# draws the boids where they were. Frames between drawn ones are skipped (their chunks are never decoded), so fast
+# forward and seeking cost only the chunks that are shown. Speeds below 1 play in slow motion, blending frames
+class FlockReplay:
+    def __init__(self, surface, path, sprites=False):
+        self.surface = surface
+        self.reader = TrajectoryReader(path)
+        self.world_size = self.reader.world_size
+        self.wrap = self.reader.wrap
+
+        self.position = 0  # playhead, in recorded frames (fractional between frames)
+        self.previous_position = 0  # playhead before the last update
+        self.speed = 1  # recorded frames per tick
+        self.max_speed = 64
+
+        self.boid_atlas = SpriteAtlas(self.surface, 6, 2, "red") if sprites else None
+        self.interpolate = False  # draw between the last two playhead positions (see Level.update)
+        self.view = self.surface.get_rect()  # area of the world that is seen
+        self.drawn_view = self.view.copy()
+        self.view_moved = False
+        self.view_margin = get_radius(6, 2)
+        self.drawn_pos = np.zeros((0, 2))
+
+    def update(self):
+        self.previous_position = self.position
+        self.position = min(self.position + self.speed, self.get_last_frame())
+
+    def get_last_frame(self):
+        return max(self.reader.frames - 1, 0)
+
+    # moves the playhead to frame (clamped to the recording)
+    def seek(self, frame):
+        self.position = min(max(frame, 0), self.get_last_frame())
+        self.previous_position = self.position
+
+    # doubles (factor 2) or halves (factor 0.5) the speed, from 1 / max_speed (slow motion) up to max_speed
+    def change_speed(self, factor):
+        self.speed = min(max(self.speed * factor, 1 / self.max_speed), self.max_speed)
+
+    # moves the view by a camera scroll value (same as Flock.scroll)
+    def scroll(self, scroll_value):
+        self.view = self.view.move(round(scroll_value[0]), round(scroll_value[1]))
+        self.view.clamp_ip(pygame.Rect((0, 0), self.world_size))
+
+    # returns (pos, vel) at a fractional frame position, blending the frames either side
+    def get_state(self, position):
+        frame = math.floor(position)
+        tick, pos, vel = self.reader.get_frame(frame)
+        blend = position - frame
+        if blend > 0 and frame + 1 < self.reader.frames:
+            tick, next_pos, next_vel = self.reader.get_frame(frame + 1)
+            moved = next_pos - pos
+            if self.wrap:
+                moved -= self.world_size * np.round(moved / self.world_size)  # short way, across the edge
+            pos = pos + moved * blend
+            vel = vel + (next_vel - vel) * blend
+            if self.wrap:
+                pos %= self.world_size
+        return pos, vel
+
+    def get_rects(self):
+        if self.view_moved:
+            return None
+        return get_rects(self.drawn_pos, get_radius(6, 2))
+
+    # alpha is how far between the last two ticks to draw (0 last tick, 1 this tick), used if interpolate.
+    # Fast forward draws the newest frame, blending frames far apart would draw boids where they never were
+    def draw(self, alpha=1):
+        if self.reader.frames == 0:
+            return
+        with profiler.scope('flock.draw'):
+            position = self.position
+            if self.interpolate and self.speed <= 1:
+                position = self.previous_position + (self.position - self.previous_position) * alpha
+            pos, vel = self.get_state(position)
+
+            if self.view.topleft != (0, 0) or self.view.size != self.world_size:
+                seen = get_in_view(pos, self.view, self.view_margin)
+                pos = pos[seen] - self.view.topleft
+                vel = vel[seen]
+            self.drawn_pos = pos
+            self.view_moved = self.view != self.drawn_view
+            self.drawn_view = self.view.copy()
+
+            if self.boid_atlas is not None:
+                self.boid_atlas.draw(pos, vel)
+            else:
+                draw_triangles(self.surface, pos, vel, 6, 2, "red")
+
+    def close(self):
+        self.reader.close()
@@ -0,0 +1,67 @@
+import random
+import numpy as np
+
+
+# named random streams split from one seed so runs are reproducible. Each subsystem (flock layout, wind, predators,
+# particles, lights...) draws from its own stream, so one drawing more or fewer numbers doesn't shift the others.
+# seed None gives the module-global random and np.random instead (unseeded, or seeded by whoever seeds those)
+class RandomStreams:
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.streams = {}  # name: random.Random
+        self.array_streams = {}  # name: np.random.RandomState
+
+    # returns the stream name as a random.Random (randint, uniform...), for single draws
+    def get(self, name):
+        if self.seed is None:
+            return random
+        if name not in self.streams:
+            # str seeds are hashed with sha512, so they don't change between runs like hash() does
+            self.streams[name] = random.Random(f'{self.seed}:{name}')
+        return self.streams[name]
+
+    # returns the stream name as a np.random.RandomState, for batched draws (one call for a whole flock)
+    def get_array(self, name):
+        if self.seed is None:
+            return np.random
+        if name not in self.array_streams:
+            self.array_streams[name] = np.random.RandomState(random.Random(f'{self.seed}:{name}').getrandbits(32))
+        return self.array_streams[name]
+
+    # returns the position of every stream as (state, arrays): state is json-able, arrays holds the numpy streams'
+    # uint32 key arrays by name. Unseeded streams save the global random and np.random (under the name '')
+    def get_state(self):
+        if self.seed is None:
+            streams = {'': random}
+            array_streams = {'': np.random}
+        else:
+            streams = self.streams
+            array_streams = self.array_streams
+
+        state = {'seed': self.seed, 'streams': {}, 'array_streams': {}}
+        arrays = {}
+        for name, stream in streams.items():
+            version, internal, gauss = stream.getstate()
+            state['streams'][name] = [version, list(internal), gauss]
+        for name, stream in array_streams.items():
+            kind, keys, pos, has_gauss, cached_gauss = stream.get_state()
+            state['array_streams'][name] = [kind, pos, has_gauss, cached_gauss]
+            arrays[name] = keys
+        return state, arrays
+
+    # puts every stream back where get_state found it (streams that didn't exist yet are created)
+    def set_state(self, state, arrays):
+        if state['seed'] != self.seed:
+            raise ValueError(f"random streams seeded with {self.seed}, state is from seed {state['seed']}")
+        for name, (version, internal, gauss) in state['streams'].items():
+            stream = random if self.seed is None else self.get(name)
+            stream.setstate((version, tuple(internal), gauss))
+        for name, (kind, pos, has_gauss, cached_gauss) in state['array_streams'].items():
+            stream = np.random if self.seed is None else self.get_array(name)
+            stream.set_state((kind, np.asarray(arrays[name], dtype=np.uint32), pos, has_gauss, cached_gauss))
+
+
+# returns (n, 2) random whole number positions from (0, 0) to (width, height) inclusive, in one draw from rng
+# (a np.random.RandomState or np.random)
+def get_random_positions(rng, n, width, height):
+    return rng.randint(0, (width + 1, height + 1), (n, 2)).astype(float)
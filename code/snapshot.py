@@ -0,0 +1,145 @@
+import json
+import numpy as np
+
+# binary snapshot of a flock's whole simulation state (boids, predators, wind, ticks and random streams) so runs can
+# be saved and resumed later.
+# File layout: magic, version and header size (16 bytes), a json header, then every array's raw bytes, each starting
+# on an alignment boundary. The header gives each array's dtype, shape and offset from the first aligned byte after
+# the header, so arrays are read (or memory mapped) in one go without parsing anything per agent
+magic = b'BOIDSNAP'
+version = 1
+alignment = 64
+
+
+# writes header (json-able dict) and arrays (name: numpy array) to path
+def write_snapshot(path, header, arrays):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // alignment) * alignment
+
+    text = json.dumps(dict(header, arrays=layout)).encode()
+    start = get_data_start(len(text))
+    with open(path, 'wb') as f:
+        f.write(magic)
+        f.write(np.array([version, len(text)], dtype='<u4').tobytes())
+        f.write(text)
+        for name, array in arrays.items():
+            f.seek(start + layout[name]['offset'])
+            array.tofile(f)
+
+
+# returns where the arrays start in a file with a header_size byte json header
+def get_data_start(header_size):
+    return -(-(16 + header_size) // alignment) * alignment
+
+
+# returns (header, arrays) from a snapshot file. mmap maps the arrays read only rather than reading them into memory
+def read_snapshot(path, mmap=False):
+    with open(path, 'rb') as f:
+        if f.read(8) != magic:
+            raise ValueError(f"'{path}' is not a flock snapshot")
+        file_version, header_size = np.frombuffer(f.read(8), dtype='<u4').tolist()
+        if file_version != version:
+            raise ValueError(f"snapshot version {file_version} is not supported (expected {version})")
+        header = json.loads(f.read(header_size))
+        start = get_data_start(header_size)
+
+        arrays = {}
+        for name, array_layout in header.pop('arrays').items():
+            dtype = np.dtype(array_layout['dtype'])
+            shape = tuple(array_layout['shape'])
+            if mmap and int(np.prod(shape)):
+                arrays[name] = np.memmap(path, dtype, 'r', start + array_layout['offset'], shape)
+            else:
+                f.seek(start + array_layout['offset'])
+                arrays[name] = np.fromfile(f, dtype, int(np.prod(shape))).reshape(shape)
+    return header, arrays
+
+
+# saves flock's simulation state to path
+def save_flock(flock, path):
+    pos, vel = flock.get_states()
+    if flock.backend == 'numpy':
+        heading = flock.boids.heading
+        last_update = flock.boids.last_update
+    else:
+        heading = np.radians([b.rot_deg for b in flock.boids])
+        last_update = np.array([b.last_update for b in flock.boids], dtype=np.int64)
+
+    predators = flock.predators
+    rng_state, rng_arrays = flock.rng.get_state()
+    header = {
+        'boids': len(pos),
+        'predators': len(predators),
+        'tick': flock.tick,
+        'wind': list(flock.wind),
+        'new_wind': list(flock.new_wind),
+        'wind_change': flock.wind_change,
+        'view': list(flock.view),
+        'rng': rng_state,
+    }
+    arrays = {
+        'pos': np.asarray(pos, dtype=float),
+        'vel': np.asarray(vel, dtype=float),
+        'heading': np.asarray(heading, dtype=float),
+        'last_update': np.asarray(last_update, dtype=np.int64),
+        'predator_pos': flock.get_predator_positions(),
+        'predator_vel': np.array([p.vel for p in predators], dtype=float).reshape(-1, 2),
+        'predator_rot': np.array([p.rot_deg for p in predators], dtype=float),
+        'predator_attack_timer': np.array([p.attack_timer for p in predators], dtype=float),
+        'predator_circling_pos': np.array([p.circling_pos for p in predators], dtype=float).reshape(-1, 2),
+    }
+    if flock.wind_field is not None:
+        header['wind_field_time'] = flock.wind_field.time
+        arrays['wind_field_keyframes'] = np.array(flock.wind_field.keyframes)
+    for name, keys in rng_arrays.items():
+        arrays[f'rng.{name}'] = keys
+    write_snapshot(path, header, arrays)
+
+
+# restores a flock saved with save_flock. The flock must have the same number of boids and predators (the backend
+# can differ)
+def load_flock(flock, path, mmap=False):
+    header, arrays = read_snapshot(path, mmap)
+    if header['boids'] != len(flock.boids) or header['predators'] != len(flock.predators):
+        raise ValueError(f"snapshot has {header['boids']} boids and {header['predators']} predators, flock has "
+                         f"{len(flock.boids)} and {len(flock.predators)}")
+    flock.rng.set_state(header['rng'], {name[4:]: keys for name, keys in arrays.items() if name.startswith('rng.')})
+
+    if flock.backend == 'numpy':
+        # in place, a pooled flock's arrays are its workers' shared memory
+        flock.boids.pos[:] = arrays['pos']
+        flock.boids.vel[:] = arrays['vel']
+        flock.boids.heading[:] = arrays['heading']
+        flock.boids.last_update[:] = arrays['last_update']
+    else:
+        states = zip(arrays['pos'].tolist(), arrays['vel'].tolist(), np.degrees(arrays['heading']).tolist(),
+                     arrays['last_update'].tolist())
+        for b, (pos, vel, rot_deg, last_update) in zip(flock.boids, states):
+            # in place, neighbours read pos and vel through b.state
+            b.pos[:] = pos
+            b.vel[:] = vel
+            b.rot_deg = rot_deg
+            b.last_update = last_update
+
+    for i, p in enumerate(flock.predators):
+        p.pos = arrays['predator_pos'][i].tolist()
+        p.vel = arrays['predator_vel'][i].tolist()
+        p.rot_deg = float(arrays['predator_rot'][i])
+        p.attack_timer = float(arrays['predator_attack_timer'][i])
+        p.circling_pos = arrays['predator_circling_pos'][i].tolist()
+
+    flock.tick = header['tick']
+    flock.wind[:] = header['wind']
+    flock.new_wind[:] = header['new_wind']
+    flock.wind_change = header['wind_change']
+    flock.view.update(header['view'])
+    if flock.wind_field is not None and 'wind_field_keyframes' in arrays:
+        flock.wind_field.keyframes = list(np.array(arrays['wind_field_keyframes']))
+        flock.wind_field.time = header['wind_field_time']
+        flock.wind_field.blend_keyframes()
+    flock.previous_pos = None  # nothing to interpolate from until the next update
+    flock.update_stats()
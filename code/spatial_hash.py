@@ -0,0 +1,219 @@
+import numpy as np
+
+
+# returns the flat cell ids of the 9 cells around each query cell (cx, cy) on a toroidal grid, as 9 arrays
+def get_wrapped_blocks(cx, cy, cells_width, cells_height):
+    return [((cy + oy) % cells_height) * cells_width + (cx + ox) % cells_width
+            for oy in (-1, 0, 1) for ox in (-1, 0, 1)]
+
+
+# returns index arrays (i, j) pairing each query i with every agent order[start[i]:end[i]], for each (start, end)
+# array pair in spans
+def get_span_pairs(spans, order):
+    pairs_i = []
+    pairs_j = []
+    for start, end in spans:
+        n = end - start
+        total = n.sum()
+        if total == 0:
+            continue
+        first = np.cumsum(n) - n
+        pairs_i.append(np.repeat(np.arange(len(n)), n))
+        pairs_j.append(order[np.repeat(start - first, n) + np.arange(total)])
+
+    if not pairs_i:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+# uniform grid spatial index, usable for any agents (boids, predators...) that can give a cell per agent.
+# Agents are binned with a counting sort into a flat cell table: order holds agent indices sorted by cell and the agents
+# of cell c are order[cell_start[c]:cell_start[c + 1]]. Cells are stored row by row, so the 3 cells of one row of a 3x3
+# neighbourhood are also one contiguous slice, meaning a neighbourhood is only ever 3 slices.
+# The cell table (cell_count, cell_start) is allocated once and the per agent cell buffer only when the number of
+# agents changes. Re-binning is a bincount, a prefix sum and a stable argsort (a new order array each insert),
+# never a dict or list per cell.
+# wrap makes the grid toroidal, neighbourhoods at an edge continue from the opposite edge (needs at least 3x3 cells)
+class SpatialHash:
+    def __init__(self, cell_size, cells_width, cells_height, origin=(0, 0), wrap=False):
+        self.cell_size = cell_size
+        self.cells_width = cells_width
+        self.cells_height = cells_height
+        self.origin = origin  # world position of the top left corner of cell (0, 0)
+        self.cell_total = cells_width * cells_height
+        self.wrap = wrap
+        if wrap and (cells_width < 3 or cells_height < 3):
+            raise ValueError('wrapping grids need at least 3x3 cells')
+
+        # numpy's stable sort on 16 bit ints is a radix sort (a counting sort per byte), so prefer 16 bit cell ids
+        self.cell_dtype = np.uint16 if self.cell_total <= 2 ** 16 else np.intp
+        self.cell_count = np.zeros(self.cell_total, dtype=np.intp)
+        self.cell_start = np.zeros(self.cell_total + 1, dtype=np.intp)  # + 1 so cell_start[c + 1] is always the end of c
+        self.cells = np.zeros(0, dtype=self.cell_dtype)  # cell of each agent
+        self.order = np.zeros(0, dtype=np.intp)  # agent indices sorted by cell
+
+    # -- binning --
+
+    # returns the (unclamped) cell column and row of each position in a (n, 2) array
+    def get_cell_coords(self, pos):
+        cx = np.floor_divide(pos[:, 0] - self.origin[0], self.cell_size).astype(np.intp)
+        cy = np.floor_divide(pos[:, 1] - self.origin[1], self.cell_size).astype(np.intp)
+        return cx, cy
+
+    # bins agents by flat cell id (row * cells_width + column), cells must be within the grid
+    def insert(self, cells):
+        size = len(cells)
+        if len(self.cells) != size:
+            self.cells = np.zeros(size, dtype=self.cell_dtype)
+        self.cells[:] = cells
+
+        # counting sort: count per cell, prefix sum gives each cell's start, stable sort places agents
+        self.cell_count[:] = np.bincount(self.cells, minlength=self.cell_total)
+        np.cumsum(self.cell_count, out=self.cell_start[1:])
+        self.order = np.argsort(self.cells, kind='stable')
+
+    def insert_coords(self, cx, cy):
+        self.insert(cy * self.cells_width + cx)
+
+    # -- queries --
+
+    def get_occupied(self):
+        return np.flatnonzero(self.cell_count)
+
+    # returns the flat ids of the occupied cells (ascending) and the start and end in order of each one's agents
+    def get_occupied_spans(self):
+        occupied = self.get_occupied()
+        return occupied, self.cell_start[occupied], self.cell_start[occupied + 1]
+
+    # returns a new list of the (start, end) slices of order covering the 3x3 block of cells around a cell (at most
+    # 3, one per row)
+    def get_block_ranges(self, cell):
+        cy, cx = divmod(int(cell), self.cells_width)
+        x0 = max(cx - 1, 0)
+        x1 = min(cx + 1, self.cells_width - 1)
+        ranges = []
+        for row in range(max(cy - 1, 0), min(cy + 1, self.cells_height - 1) + 1):
+            start = self.cell_start[row * self.cells_width + x0]
+            end = self.cell_start[row * self.cells_width + x1 + 1]
+            if end > start:
+                ranges.append((start, end))
+        return ranges
+
+    # returns index arrays (i, j) pairing every query i (with cell column cx[i] and row cy[i]) with every binned agent j
+    # in the 3x3 block of cells around it
+    def get_block_pairs(self, cx, cy):
+        if self.wrap:
+            cells = get_wrapped_blocks(cx, cy, self.cells_width, self.cells_height)
+            return get_span_pairs([(self.cell_start[c], self.cell_start[c + 1]) for c in cells], self.order)
+
+        queries = np.arange(len(cx))
+        x0 = np.maximum(cx - 1, 0)
+        x1 = np.minimum(cx + 1, self.cells_width - 1)
+        pairs_i = []
+        pairs_j = []
+        for oy in (-1, 0, 1):
+            row = cy + oy
+            valid = (0 <= row) & (row < self.cells_height)
+            row = np.where(valid, row, 0)
+            start = self.cell_start[row * self.cells_width + x0]
+            n = np.where(valid, self.cell_start[row * self.cells_width + x1 + 1] - start, 0)
+            total = n.sum()
+            if total == 0:
+                continue
+            # each query is repeated once per agent in the row span, j walks that span of order
+            first = np.cumsum(n) - n
+            pairs_i.append(np.repeat(queries, n))
+            pairs_j.append(self.order[np.repeat(start - first, n) + np.arange(total)])
+
+        if not pairs_i:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+# SpatialHash for very large grids, storing only the occupied cells. Agents are sorted by flat cell id, keys holds
+# the id of each occupied cell (ascending) and the agents of the k-th occupied cell are
+# order[cell_start[k]:cell_start[k + 1]]. Neighbourhood rows are found by binary search on keys, so memory and
+# binning cost follow the number of agents rather than the area of the grid.
+# Same binning and pair queries as SpatialHash (cells_width and cells_height are only the extent of the grid)
+class SparseSpatialHash:
+    def __init__(self, cell_size, cells_width, cells_height, origin=(0, 0), wrap=False):
+        self.cell_size = cell_size
+        self.cells_width = cells_width
+        self.cells_height = cells_height
+        self.origin = origin
+        self.cell_total = cells_width * cells_height
+        self.wrap = wrap
+        if wrap and (cells_width < 3 or cells_height < 3):
+            raise ValueError('wrapping grids need at least 3x3 cells')
+
+        self.keys = np.zeros(0, dtype=np.int64)  # flat id of each occupied cell
+        self.cell_start = np.zeros(1, dtype=np.intp)
+        self.order = np.zeros(0, dtype=np.intp)
+
+    # -- binning --
+
+    def get_cell_coords(self, pos):
+        cx = np.floor_divide(pos[:, 0] - self.origin[0], self.cell_size).astype(np.intp)
+        cy = np.floor_divide(pos[:, 1] - self.origin[1], self.cell_size).astype(np.intp)
+        return cx, cy
+
+    # bins agents by flat cell id (row * cells_width + column), cells must be within the grid
+    def insert(self, cells):
+        cells = np.asarray(cells, dtype=np.int64)
+        # stable, so each cell lists its agents in agent order (same as SpatialHash)
+        self.order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[self.order]
+        # a new cell starts wherever the sorted id changes
+        starts = np.flatnonzero(sorted_cells[1:] != sorted_cells[:-1]) + 1
+        self.cell_start = np.concatenate(([0], starts, [len(cells)])).astype(np.intp)
+        self.keys = sorted_cells[self.cell_start[:-1]] if len(cells) else np.zeros(0, dtype=np.int64)
+
+    def insert_coords(self, cx, cy):
+        self.insert(cy.astype(np.int64) * self.cells_width + cx)
+
+    # -- queries --
+
+    # flat ids of the occupied cells
+    def get_occupied(self):
+        return self.keys
+
+    def get_occupied_spans(self):
+        return self.keys, self.cell_start[:-1], self.cell_start[1:]
+
+    # returns index arrays (i, j) pairing every query i (with cell column cx[i] and row cy[i]) with every binned agent j
+    # in the 3x3 block of cells around it
+    def get_block_pairs(self, cx, cy):
+        if self.wrap:
+            spans = []
+            for cells in get_wrapped_blocks(cx.astype(np.int64), cy.astype(np.int64), self.cells_width,
+                                            self.cells_height):
+                spans.append((self.cell_start[np.searchsorted(self.keys, cells, 'left')],
+                              self.cell_start[np.searchsorted(self.keys, cells, 'right')]))
+            return get_span_pairs(spans, self.order)
+
+        queries = np.arange(len(cx))
+        x0 = np.maximum(cx - 1, 0)
+        x1 = np.minimum(cx + 1, self.cells_width - 1)
+        pairs_i = []
+        pairs_j = []
+        for oy in (-1, 0, 1):
+            row = (cy + oy).astype(np.int64)
+            valid = (0 <= row) & (row < self.cells_height)
+            # occupied cells of a row span are a contiguous run of keys, so 2 binary searches find them
+            first_cell = np.searchsorted(self.keys, row * self.cells_width + x0, 'left')
+            last_cell = np.searchsorted(self.keys, row * self.cells_width + x1, 'right')
+            start = self.cell_start[first_cell]
+            n = np.where(valid, self.cell_start[last_cell] - start, 0)
+            total = n.sum()
+            if total == 0:
+                continue
+            first = np.cumsum(n) - n
+            pairs_i.append(np.repeat(queries, n))
+            pairs_j.append(self.order[np.repeat(start - first, n) + np.arange(total)])
+
+        if not pairs_i:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
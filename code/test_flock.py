@@ -0,0 +1,53 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import numpy as np
+import pygame
+import pytest
+import boid_arrays
+from boids import Flock
+from rng import RandomStreams
+from snapshot import save_flock, load_flock
+
+
+def run_flock(ticks, **kwargs):
+    flock = Flock(pygame.Surface((1280, 720)), rng=RandomStreams(4), **kwargs)
+    try:
+        for t in range(ticks):
+            flock.update()
+        return flock.boids.pos.copy(), flock.boids.vel.copy()
+    finally:
+        flock.close()
+
+
+# parallel updates must match the serial update exactly, also when the pairs are split into several batches
+@pytest.mark.parametrize('workers', [1, 3])
+def test_workers_match_serial(monkeypatch, workers):
+    monkeypatch.setattr(boid_arrays, 'pair_batch_size', 5000)
+    serial = run_flock(40, flock_size=500, backend='numpy', use_predator=True, use_wind=True)
+    parallel = run_flock(40, flock_size=500, backend='numpy', use_predator=True, use_wind=True, workers=workers)
+    assert np.array_equal(serial[0], parallel[0])
+    assert np.array_equal(serial[1], parallel[1])
+
+
+# a restored flock carries on exactly like the flock it was saved from, here with predators aiming at the boids
+# around them part way through an attack
+@pytest.mark.parametrize('backend', ['objects', 'numpy'])
+def test_restore_matches_uninterrupted_run(tmp_path, backend):
+    kwargs = dict(flock_size=300, use_predator=True, use_wind=True, backend=backend, predators=3,
+                  predator_targeting='local')
+    flock = Flock(pygame.Surface((1280, 720)), rng=RandomStreams(2), **kwargs)
+    while not any(-p.attack_duration <= p.attack_timer < 0 for p in flock.predators):
+        flock.update()
+    path = tmp_path / 'flock.snap'
+    save_flock(flock, path)
+    for t in range(300):
+        flock.update()
+
+    restored = Flock(pygame.Surface((1280, 720)), rng=RandomStreams(2), **kwargs)
+    for t in range(10):
+        restored.update()  # state the snapshot must replace
+    load_flock(restored, path)
+    for t in range(300):
+        restored.update()
+    assert np.array_equal(flock.get_states()[0], restored.get_states()[0])
+    assert np.array_equal(flock.get_predator_positions(), restored.get_predator_positions())
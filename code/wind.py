@@ -0,0 +1,102 @@
+import numpy as np
+
+
+# returns the bilinear samples (n, ...) of grid (rows, columns, ...) at grid coordinates gx, gy (n,), in grid cells
+# from node (0, 0). wrap makes the grid periodic (the last node is followed by the first), otherwise coordinates are
+# clamped to the grid
+def sample_grid(grid, gx, gy, wrap=False):
+    rows, columns = grid.shape[:2]
+    x0 = np.floor(gx)
+    y0 = np.floor(gy)
+    fx = gx - x0
+    fy = gy - y0
+    x0 = x0.astype(np.intp)
+    y0 = y0.astype(np.intp)
+    if wrap:
+        x0 %= columns
+        y0 %= rows
+        x1 = (x0 + 1) % columns
+        y1 = (y0 + 1) % rows
+    else:
+        outside = (x0 < 0) | (x0 >= columns - 1)
+        fx[outside] = (gx[outside] > 0).astype(float)
+        outside = (y0 < 0) | (y0 >= rows - 1)
+        fy[outside] = (gy[outside] > 0).astype(float)
+        np.clip(x0, 0, max(columns - 2, 0), out=x0)
+        np.clip(y0, 0, max(rows - 2, 0), out=y0)
+        x1 = np.minimum(x0 + 1, columns - 1)
+        y1 = np.minimum(y0 + 1, rows - 1)
+
+    shape = (-1,) + (1,) * (grid.ndim - 2)
+    fx = fx.reshape(shape)
+    fy = fy.reshape(shape)
+    top = grid[y0, x0] + (grid[y0, x1] - grid[y0, x0]) * fx
+    bottom = grid[y1, x0] + (grid[y1, x1] - grid[y1, x0]) * fx
+    return top + (bottom - top) * fy
+
+
+# wind that varies over the world. Layers of value noise (random vectors on grids of nodes, each layer twice as fine
+# and half as strong as the one before) are summed onto one coarse grid of wind vectors, a new one (keyframe) every
+# change_time ticks, and the grid blends smoothly from one keyframe to the next. Boids read the wind where they are
+# with one batched bilinear lookup (sample) a tick, so the noise itself is only ever evaluated at the grid nodes
+class WindField:
+    # rng (np.random or a np.random.RandomState) draws the noise. strength is the largest wind the coarsest layer
+    # adds along each axis
+    def __init__(self, world_size, wrap=False, rng=np.random, cell_size=160, layers=3, strength=1.5,
+                 change_time=60 * 10):
+        self.width, self.height = world_size
+        self.wrap = wrap
+        self.rng = rng
+        self.layers = layers
+        self.strength = strength
+        self.change_time = change_time
+
+        # wrapped worlds are split into whole cells so the grid tiles seamlessly, otherwise there is a node on each
+        # edge of the world
+        self.columns = max(round(self.width / cell_size), 1)
+        self.rows = max(round(self.height / cell_size), 1)
+        if not wrap:
+            self.columns += 1
+            self.rows += 1
+        self.cells = (self.columns if wrap else self.columns - 1, self.rows if wrap else self.rows - 1)
+        self.scale = (self.cells[0] / self.width, self.cells[1] / self.height)  # grid cells per pixel
+
+        self.keyframes = [self.get_noise(), self.get_noise()]
+        self.time = 0  # ticks (at 60 a second) since the first keyframe
+        self.grid = self.keyframes[0].copy()  # wind (x, y) at each node this tick
+
+    # returns a (rows, columns, 2) grid of summed noise layers
+    def get_noise(self):
+        gx, gy = np.meshgrid(np.arange(self.columns, dtype=float), np.arange(self.rows, dtype=float))
+        gx = gx.ravel()
+        gy = gy.ravel()
+        grid = np.zeros((self.rows * self.columns, 2))
+        for layer in range(self.layers):
+            # cells of this layer, coarsest first. Wrapped layers need whole cells to tile across the edges
+            step = 2 ** (self.layers - 1 - layer)
+            if self.wrap:
+                cells = [max(c // step, 1) for c in self.cells]
+            else:
+                cells = [max(-(-c // step), 1) for c in self.cells]
+            shape = (cells[1] + (not self.wrap), cells[0] + (not self.wrap), 2)
+            noise = self.rng.uniform(-1, 1, shape) * (self.strength / 2 ** layer)
+            grid += sample_grid(noise, gx * (cells[0] / self.cells[0]), gy * (cells[1] / self.cells[1]), self.wrap)
+        return grid.reshape(self.rows, self.columns, 2)
+
+    # moves the field on a tick of step ticks at 60 a second (change_time counts those)
+    def update(self, step=1):
+        self.time += step
+        if self.time >= self.change_time:
+            self.time = 0
+            self.keyframes = [self.keyframes[1], self.get_noise()]
+        self.blend_keyframes()
+
+    # sets grid from the keyframes and time
+    def blend_keyframes(self):
+        blend = self.time / self.change_time
+        blend = blend * blend * (3 - 2 * blend)  # smoothstep, no sudden change in how fast the wind changes
+        self.grid = self.keyframes[0] + (self.keyframes[1] - self.keyframes[0]) * blend
+
+    # returns the wind (n, 2) at positions pos (n, 2)
+    def sample(self, pos):
+        return sample_grid(self.grid, pos[:, 0] * self.scale[0], pos[:, 1] * self.scale[1], self.wrap)